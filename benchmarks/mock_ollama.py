@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for an Ollama server, for benchmarks on machines without a GPU.
+# /api/generate streams NDJSON like the real server: prose-like tokens at a
+# fixed rate after a fixed latency plus a prompt-evaluation delay. Each of
+# --parallel slots remembers its last prompt, so a shared prefix is "cached"
+# and only the new characters count as evaluated, as with Ollama's KV reuse.
+# An empty prompt only "loads" the model, which /api/ps then lists with its
+# keep_alive. GET /_stats returns per-request records and POST /_reset clears
+# them.
+#
+#   python benchmarks/mock_ollama.py --port 11500 --token-rate 2000 --latency 0.05
+
+WORDS = "the wind moved across the dunes while Bingo watched the machines hum".split()
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.slots = [""] * args.parallel
+        self.records = []
+        self.loaded = {}  # model -> keep_alive of its last request
+
+    # Pick the slot sharing the longest prefix with prompt; returns cached chars
+    def claim_slot(self, prompt):
+        with self.lock:
+            best = max(range(len(self.slots)), key=lambda i: len(os.path.commonprefix([self.slots[i], prompt])))
+            cached = len(os.path.commonprefix([self.slots[best], prompt]))
+            self.slots[best] = prompt
+            return cached
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": name} for name in self.state.args.models]})
+        elif self.path == "/api/ps":
+            with self.state.lock:
+                self._send_json({"models": [{"name": name, "keep_alive": keep_alive} for name, keep_alive in self.state.loaded.items()]})
+        elif self.path == "/_stats":
+            with self.state.lock:
+                self._send_json({"records": list(self.state.records)})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/_reset":
+            with self.state.lock:
+                self.state.records.clear()
+                self.state.loaded.clear()
+                self.state.slots = [""] * self.state.args.parallel
+            return self._send_json({})
+        if self.path != "/api/generate":
+            return self.send_error(404)
+        self._generate(json.loads(body), len(body))
+
+    def _generate(self, request, body_bytes):
+        args = self.state.args
+        started = time.perf_counter()
+        prompt = request.get("prompt", "")
+        options = request.get("options", {})
+        with self.state.lock:
+            self.state.loaded[request.get("model")] = request.get("keep_alive")
+        if not prompt:
+            return self._send_json({"model": request.get("model"), "response": "", "done": True, "done_reason": "load"})
+        cached = self.state.claim_slot(prompt)
+        prompt_tokens = max(1, (len(prompt) - cached) // 4)
+        tokens = options.get("num_predict") or args.tokens
+        if tokens < 0:
+            tokens = args.tokens
+        time.sleep(args.latency + prompt_tokens / args.prompt_rate)
+        prompt_done = time.perf_counter()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        complete = True
+        try:
+            batch = max(1, int(args.token_rate * 0.01))  # ~10 ms worth of tokens per write
+            while sent < tokens:
+                pieces = []
+                for _ in range(min(batch, tokens - sent)):
+                    word = WORDS[sent % len(WORDS)]
+                    pieces.append(json.dumps({"model": request.get("model"), "response": word + (". " if sent % 12 == 11 else " "), "done": False}) + "\n")
+                    sent += 1
+                self._chunk("".join(pieces))
+                time.sleep(len(pieces) / args.token_rate)
+            finished = time.perf_counter()
+            self._chunk(json.dumps({
+                "model": request.get("model"), "response": "", "done": True, "done_reason": "length",
+                "total_duration": int((finished - started) * 1e9), "load_duration": 0,
+                "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int((prompt_done - started) * 1e9),
+                "eval_count": sent, "eval_duration": int((finished - prompt_done) * 1e9), "context": [1, 2, 3],
+            }) + "\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            complete = False  # Client stopped the stream (cancel or word ceiling)
+        with self.state.lock:
+            self.state.records.append({
+                "prompt_bytes": len(prompt.encode("utf-8")), "body_bytes": body_bytes, "prompt_eval_count": prompt_tokens,
+                "eval_count": sent, "seconds": time.perf_counter() - started, "complete": complete,
+                "keep_alive": request.get("keep_alive"),
+            })
+
+    def _chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock Ollama server streaming synthetic NDJSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="Generated tokens per second per request")
+    parser.add_argument("--prompt-rate", type=float, default=50000.0, help="Uncached prompt tokens evaluated per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fixed seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens per response when the request sets no num_predict")
+    parser.add_argument("--parallel", type=int, default=4, help="Slots with their own prompt cache (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--models", nargs="+", default=["mock:latest"])
+    return parser
+
+
+def serve(args):
+    Handler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    serve(build_parser().parse_args()).serve_forever()
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Benchmark harness: runs engine scenarios against benchmarks/mock_ollama.py
+# on synthetic manuscripts and writes a JSON report (wall time, throughput,
+# p50/p95 request latency, prompt bytes, peak RSS). Every scenario/size pair
+# runs in a fresh interpreter so peak RSS and in-process caches are its own.
+#
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --scenarios review fix_language --sizes 10000 100000 500000
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SCENARIOS = ("startup", "chapter", "enhance", "review", "fix_language", "retrieval", "align")
+HEAVY_MODULES = ("langdetect", "googletrans", "tkinter")  # Should not load before they are needed
+MODEL = "mock:latest"
+
+VOCABULARY = ("wind dune machine desert Bingo Waffle syrup signal tower dust engine silent night "
+              "light road old city broken voice answer shadow iron glass river cold").split()
+FOREIGN = ["El viento aullaba sobre las dunas mientras la ciudad dormía número {}.",
+           "Le vent hurlait sur les dunes pendant que la ville dormait numéro {}."]
+
+
+def synthetic_manuscript(words, chapters=5, foreign_every=0, seed=7):
+    rng = random.Random(seed)
+    per_chapter = max(1, words // chapters)
+    parts = []
+    for number in range(1, chapters + 1):
+        paragraphs, count = [], 0
+        while count < per_chapter:
+            if foreign_every and len(paragraphs) % foreign_every == foreign_every - 1:
+                paragraphs.append(FOREIGN[len(paragraphs) % 2].format(rng.randint(0, 10 ** 6)))
+            else:
+                sentences = [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(8, 16))).capitalize() + "." for _ in range(rng.randint(3, 6))]
+                paragraphs.append("The " + " ".join(sentences))
+            count += len(paragraphs[-1].split())
+        parts.append(f"--- Chapter {number}: Title {number} ---\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(parts)
+
+
+def synthetic_storyboard(chapters, sections, word_count):
+    return {"chapters": [{
+        "number": number + 1, "title": f"Title {number + 1}", "setting": "The desert city",
+        "characters_present": ["Bingo", "Waffle"],
+        "sections": [{"task": f"Section {s + 1} of chapter {number + 1}", "word_count": word_count} for s in range(sections)],
+    } for number in range(chapters)]}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Runs inside the child interpreter; returns scenario-specific counters
+def run_scenario(scenario, size, args, temp_folder):
+    sys.path.insert(0, REPO_DIR)
+    if scenario == "startup":  # Import cost of the entry points (the GUI window itself is not opened)
+        started = time.perf_counter()
+        import book_writer_cli
+        cli_s = time.perf_counter() - started
+        heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+        import ollama_book_writer
+        return {"words_out": 0, "cli_import_s": round(cli_s, 3), "gui_import_s": round(time.perf_counter() - started - cli_s, 3),
+                "cli_heavy_modules": heavy}
+    import manuscript_index
+    import ollama_client
+    import retrieval_index
+    import story_engine
+    import story_fixer
+    import story_review
+
+    if scenario == "align":  # Storyboard alignment of a manuscript file; no requests
+        return align_scenario(size, args, temp_folder)
+
+    ollama_client.configure(base_url=f"127.0.0.1:{args.port}")
+    manuscript = synthetic_manuscript(size, args.chapters, foreign_every=50 if scenario == "fix_language" else 0)
+
+    if scenario == "chapter":
+        project = story_engine.BookProject(synthetic_storyboard(args.chapters, args.sections, args.section_words),
+                                           {"Bingo": "a dog"}, "Write well.", "", manuscript, temp_folder)
+        story_engine.setup_run_log(temp_folder, "llm_generation.log")
+        results = story_engine.generate_book(project, MODEL, concurrency=args.concurrency)
+        return {"words_out": sum(result["word_count"] for result in results)}
+    if scenario == "enhance":
+        project = story_engine.BookProject(synthetic_storyboard(args.chapters, args.sections, args.section_words // 2),
+                                           {"Bingo": "a dog"}, "Write well.", "", manuscript, temp_folder)
+        text = story_engine.enhance_story(project, MODEL, concurrency=args.concurrency)
+        return {"words_out": len(text.split())}
+    if scenario == "review":
+        text = story_review.review_manuscript(manuscript, MODEL, temp_folder, args.concurrency)
+        return {"words_out": len(text.split())}
+    if scenario == "retrieval":  # Index build and query cost only; no requests
+        index = retrieval_index.RetrievalIndex()
+        spans = manuscript_index.chapter_spans(manuscript)
+        started = time.perf_counter()
+        for span in spans:
+            index.update_source(f"chapter {span.number}", span.text(manuscript))
+        build_s = time.perf_counter() - started
+        queries = [f"{section['task']} {' '.join(chapter['characters_present'])} {chapter['setting']}"
+                   for chapter in synthetic_storyboard(args.chapters, args.sections, 0)["chapters"] for section in chapter["sections"]]
+        started = time.perf_counter()
+        for query in queries:
+            index.query(query, 5)
+        query_s = (time.perf_counter() - started) / len(queries)
+        started = time.perf_counter()
+        index.update_source(f"chapter {spans[-1].number}", spans[-1].text(manuscript) + "\n\nOne more paragraph.")
+        return {"words_out": 0, "retrieval_build_s": round(build_s, 3), "retrieval_query_ms": round(query_s * 1000, 2),
+                "retrieval_update_s": round(time.perf_counter() - started, 3), "retrieval_passages": len(index)}
+    if scenario == "fix_language":
+        text = story_fixer.fix_language_text(manuscript, story_fixer.IdentityBackend())
+        return {"words_out": len(text.split())}
+    raise ValueError(f"Unknown scenario {scenario!r}")
+
+
+# The manuscript is written chapter by chapter with drifted headings (word
+# numbers, retitled, one chapter missing, one extra) so the peak RSS is the
+# aligner's, not the input's
+def align_scenario(size, args, temp_folder):
+    import story_fixer
+    input_path = os.path.join(temp_folder, "align_input.txt")
+    storyboard_path = os.path.join(temp_folder, "align_storyboard.json")
+    with open(storyboard_path, "w", encoding="utf-8") as f:
+        json.dump(synthetic_storyboard(args.chapters, args.sections, args.section_words), f)
+    numbers = [number for number in range(1, args.chapters + 1) if number != 2] + [args.chapters + 1]
+    with open(input_path, "w", encoding="utf-8") as f:
+        for number in numbers:
+            body = synthetic_manuscript(max(1, size // len(numbers)), 1, seed=number).split("\n", 1)[1]
+            heading = f"CHAPTER {number}: The Title {number}" if number % 2 else f"--- Chapter {number}: Title {number} ---"
+            f.write(f"{heading}\n{body}\n\n")
+    started = time.perf_counter()
+    report = story_fixer.align_file(input_path, storyboard_path, os.path.join(temp_folder, "align_output.txt"))
+    return {"words_out": sum(chapter["words"] for chapter in report["chapters"]) + sum(block["words"] for block in report["excess"]),
+            "align_s": round(time.perf_counter() - started, 3), "align_missing": report["missing"],
+            "align_excess": len(report["excess"])}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))], 4)
+
+
+def _mock_call(port, path, method="GET"):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=b"{}" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_mock(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return _mock_call(port, "/api/tags")
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Mock Ollama server did not start")
+
+
+def measure(scenario, size, args):
+    _mock_call(args.port, "/_reset", "POST")
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario, str(size)] + _shared_flags(args)
+    started = time.perf_counter()
+    child = subprocess.run(command, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if child.returncode != 0:
+        return {"scenario": scenario, "size_words": size, "error": child.stderr.strip().splitlines()[-1:] or ["failed"]}
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    records = _mock_call(args.port, "/_stats")["records"]
+    latencies = [record["seconds"] for record in records]
+    return {
+        "scenario": scenario,
+        "size_words": size,
+        "wall_s": round(wall, 3),
+        "scenario_s": result["scenario_s"],
+        "words_out": result["words_out"],
+        "words_per_s": round(result["words_out"] / result["scenario_s"], 1) if result["scenario_s"] else None,
+        "requests": len(records),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "prompt_bytes_total": sum(record["prompt_bytes"] for record in records),
+        "prompt_bytes_max": max((record["prompt_bytes"] for record in records), default=0),
+        "prompt_eval_tokens": sum(record["prompt_eval_count"] for record in records),
+        "generated_tokens": sum(record["eval_count"] for record in records),
+        "peak_rss_mb": result["peak_rss_mb"],
+        **{key: value for key, value in result.items() if key.startswith(("cli_", "gui_", "retrieval_", "align_"))},
+    }
+
+
+def _shared_flags(args):
+    return ["--port", str(args.port), "--chapters", str(args.chapters), "--sections", str(args.sections),
+            "--section-words", str(args.section_words), "--concurrency", str(args.concurrency)]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the story engine against a mock Ollama server.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000], help="Synthetic manuscript sizes in words")
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=3)
+    parser.add_argument("--section-words", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="Mock tokens per second per request")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock seconds before the first token")
+    parser.add_argument("--port", type=int, default=0, help="Mock server port (default: a free port)")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "SIZE"), help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        scenario, size = args.child[0], int(args.child[1])
+        with tempfile.TemporaryDirectory() as temp_folder:
+            started = time.perf_counter()
+            result = run_scenario(scenario, size, args, temp_folder)
+            result["scenario_s"] = round(time.perf_counter() - started, 3)
+        result["peak_rss_mb"] = peak_rss_mb()
+        print(json.dumps(result))
+        return 0
+
+    args.port = args.port or _free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "mock_ollama.py"), "--port", str(args.port),
+                             "--token-rate", str(args.token_rate), "--latency", str(args.latency), "--parallel", str(args.concurrency)])
+    try:
+        _wait_for_mock(args.port)
+        results = []
+        for scenario in args.scenarios:
+            for size in ([0] if scenario == "startup" else args.sizes):
+                print(f"Running {scenario} on {size} words...", flush=True)
+                results.append(measure(scenario, size, args))
+                print(f"  {json.dumps(results[-1])}", flush=True)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {key: getattr(args, key) for key in ("chapters", "sections", "section_words", "concurrency", "token_rate", "latency")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
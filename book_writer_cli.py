@@ -0,0 +1,132 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import model_lifecycle
+import ollama_client
+import prompt_builder
+import response_cache
+import run_metrics
+import story_engine
+import story_fixer
+from story_engine import GenerationError
+
+# Batch command-line entry point: runs the same engine as the GUI without a display.
+#
+#   python book_writer_cli.py storyboard.json --characters characters.json --story "1 story file.txt"
+#   python book_writer_cli.py boards/*.json --temp-folder runs --jobs 4
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate books from JSON storyboards with Ollama (no GUI).")
+    parser.add_argument("storyboards", nargs="+", help="Storyboard JSON file(s); each one is generated as its own book")
+    parser.add_argument("--mode", choices=["generate", "enhance", "review", "fix-language"], default="generate")
+    parser.add_argument("--characters", help="Main characters JSON file")
+    parser.add_argument("--instructions", help="Instructions TXT file")
+    parser.add_argument("--other-info", help="Other important info TXT file")
+    parser.add_argument("--story", help="Chapter 1 / existing story TXT file")
+    parser.add_argument("--temp-folder", default=os.getcwd(), help="Output folder; with several storyboards each book gets a sub-folder named after it")
+    parser.add_argument("--model", default=story_engine.DEFAULT_MODEL)
+    parser.add_argument("--ollama-url", help="Ollama base URL, or several separated by commas to spread requests across hosts (default: $OLLAMA_HOSTS, $OLLAMA_HOST or http://localhost:11434)")
+    parser.add_argument("--reuse-cached", action="store_true", help="Answer identical requests from the response cache in the temp folder")
+    parser.add_argument("--cache-max-mb", type=int, default=response_cache.DEFAULT_MAX_BYTES // (1024 * 1024), help="Response cache size before least recently used entries are evicted")
+    parser.add_argument("--max-context", type=int, default=prompt_builder.DEFAULT_MAX_CTX, help="Largest num_ctx to request; prompts over budget are trimmed, oldest context first")
+    parser.add_argument("--read-timeout", type=float, default=300.0, help="Seconds a stream may stall before the request fails")
+    parser.add_argument("--start-chapter", type=int, default=story_engine.FIRST_CHAPTER, help="Chapter position to start generating from (2 = first storyboard chapter)")
+    parser.add_argument("--resume", action="store_true", help="Reuse sections checkpointed in the temp folder's generation journal and continue from the first incomplete one")
+    parser.add_argument("--word-ceiling", type=float, default=story_engine.DEFAULT_WORD_CEILING, help="Cut a section's stream at the first sentence end past this multiple of its word count (0 = off)")
+    parser.add_argument("--enhance-scope", choices=story_engine.ENHANCE_SCOPES, default="chapter", help="Per-section enhancement context: the matching chapter of the manuscript, or the whole book")
+    parser.add_argument("--translator", choices=story_fixer.TRANSLATION_BACKENDS, default="googletrans", help="Backend for --mode fix-language; ollama translates with --model")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of books to run in parallel")
+    parser.add_argument("--concurrency", type=int, default=1, help="Max /api/generate requests in flight per book (match OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--memory", choices=story_engine.MEMORY_MODES, default="full", help="Previous-chapter context: every chapter in full, latest chapter plus cached summaries, or the end of the latest chapter plus passages retrieved per section")
+    parser.add_argument("--world", nargs="+", default=[], metavar="FILE", help="World notes searched in retrieval memory mode (besides temp_world.txt in the temp folder)")
+    parser.add_argument("--memory-budget", type=int, default=story_engine.DEFAULT_MEMORY_BUDGET, help="Token budget for previous-chapter context in summary mode")
+    parser.add_argument("--independent-chapters", action="store_true", help="Also generate chapters in parallel; each only sees chapters already on disk")
+    return parser
+
+
+def book_temp_folder(args, storyboard_path):
+    if len(args.storyboards) == 1:
+        return args.temp_folder
+    name = os.path.splitext(os.path.basename(storyboard_path))[0]
+    return os.path.join(args.temp_folder, name)
+
+
+def configure_client(args):
+    ollama_client.configure(base_url=args.ollama_url, read_timeout=args.read_timeout)
+    prompt_builder.configure_budget(max_ctx=args.max_context)
+
+
+def run_book(args, storyboard_path):
+    temp_folder = book_temp_folder(args, storyboard_path)
+    os.makedirs(temp_folder, exist_ok=True)
+    client = ollama_client.get_client()
+    client.cache = response_cache.open_cache(temp_folder, args.cache_max_mb * 1024 * 1024) if args.reuse_cached else None
+    client.metrics = run_metrics.open_metrics(temp_folder)
+    project = story_engine.load_project(
+        storyboard_path=storyboard_path,
+        characters_path=args.characters,
+        instructions_path=args.instructions,
+        other_info_path=args.other_info,
+        story_path=args.story,
+        temp_folder=temp_folder,
+    )
+    project.memory_mode = args.memory
+    project.memory_budget = args.memory_budget
+    project.world_files = args.world
+    project.word_ceiling = args.word_ceiling
+    status = lambda message: print(f"[{os.path.basename(storyboard_path)}] {message}", flush=True)
+    # Keep the model loaded for the whole book
+    with model_lifecycle.get_lifecycle().pinned(args.model, status):
+        if args.mode == "generate":
+            story_engine.setup_run_log(temp_folder, "llm_generation.log")
+            story_engine.enable_journal(project, resume=args.resume)
+            results = story_engine.generate_book(project, args.model, start_pos=args.start_chapter, status=status,
+                                                 concurrency=args.concurrency, independent_chapters=args.independent_chapters)
+            return f"{len(results)} chapters written to {temp_folder}"
+        if args.mode == "enhance":
+            story_engine.enhance_story(project, args.model, status=status, concurrency=args.concurrency, scope=args.enhance_scope)
+            return f"Enhanced story written to {temp_folder}"
+        if args.mode == "fix-language":
+            if not project.book_text:
+                raise GenerationError("--mode fix-language needs the story to fix (--story)")
+            fixed = story_fixer.fix_language_text(project.book_text, story_fixer.get_translator(args.translator, args.model))
+            fixed_path = story_engine.write_final_story(temp_folder, fixed, "temp_fixed_story.txt")
+            return f"Language-fixed story written to {fixed_path}"
+        review = story_engine.generate_review_text(project.book_text, args.model, temp_folder=temp_folder, concurrency=args.concurrency, status=status)
+        review_path = os.path.join(temp_folder, "temp_review.txt")
+        with open(review_path, "w", encoding="utf-8") as f:
+            f.write(review)
+        return f"Review written to {review_path}"
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    args = build_parser().parse_args(argv)
+    configure_client(args)
+    failures = 0
+    if args.jobs <= 1 or len(args.storyboards) == 1:
+        for storyboard_path in args.storyboards:
+            try:
+                print(run_book(args, storyboard_path))
+            except (GenerationError, OSError, ValueError) as e:
+                print(f"Error in {storyboard_path}: {e}", file=sys.stderr)
+                failures += 1
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=configure_client, initargs=(args,)) as pool:
+            futures = {pool.submit(run_book, args, path): path for path in args.storyboards}
+            for future in as_completed(futures):
+                try:
+                    print(future.result())
+                except (GenerationError, OSError, ValueError) as e:
+                    print(f"Error in {futures[future]}: {e}", file=sys.stderr)
+                    failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+
+# Append-only checkpoint journal for chapter generation. Every streamed chunk,
+# every finished section and every saved chapter is written to
+# generation_journal.jsonl in the temp folder as it happens, so a crash or a
+# restart only loses the request that was in flight. Sections are keyed by
+# chapter number, section index and a hash of the untrimmed prompt inputs, so a
+# changed storyboard or changed previous chapters never resume stale text.
+# Saved chapters are recorded per book (a hash of the seed story and the
+# storyboard), so a new seed or storyboard starts from its first chapter.
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "generation_journal.jsonl"
+
+
+# texts are the section's prompt inputs before PromptAssembler.fit(), whose
+# trimming depends on the calibrated tokens-per-word and so differs after a
+# restart
+def section_key(chapter_num, section_idx, *texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return f"{chapter_num}:{section_idx}:{digest.hexdigest()[:16]}"
+
+
+def book_key(seed_text, storyboard_json):
+    return hashlib.sha256(f"{seed_text}\0{storyboard_json}".encode("utf-8")).hexdigest()[:16]
+
+
+class GenerationJournal:
+    def __init__(self, temp_folder):
+        self.path = os.path.join(temp_folder, JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.completed = {}  # section key -> final text
+        self.partial = {}  # section key -> list of chunks since the last start
+        self.chapters = set()  # (book key, chapter number) of every saved chapter file
+        self._load()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from a crash
+                kind = event.get("event")
+                key = event.get("key")
+                if kind == "start":
+                    self.partial[key] = []
+                elif kind == "chunk":
+                    self.partial.setdefault(key, []).append(event["text"])
+                elif kind == "section":
+                    self.completed[key] = event["text"]
+                    self.partial.pop(key, None)
+                elif kind == "chapter":
+                    self.chapters.add((event.get("book"), event["chapter"]))
+        logger.info(f"Journal loaded: {len(self.completed)} completed sections, {len(self.partial)} partial, {len(self.chapters)} chapters")
+
+    def _write(self, event):
+        with self.lock:
+            self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def start_section(self, key):
+        self.partial[key] = []
+        self._write({"event": "start", "key": key})
+
+    def record_chunk(self, key, text):
+        self.partial.setdefault(key, []).append(text)
+        self._write({"event": "chunk", "key": key, "text": text})
+
+    def record_section(self, key, text):
+        self.completed[key] = text
+        self.partial.pop(key, None)
+        self._write({"event": "section", "key": key, "text": text})
+
+    def record_chapter(self, chapter_num, path, book=None):
+        self.chapters.add((book, chapter_num))
+        self._write({"event": "chapter", "chapter": chapter_num, "path": path, "book": book})
+
+    def has_chapter(self, chapter_num, book=None):
+        return (book, chapter_num) in self.chapters
+
+    def completed_text(self, key):
+        return self.completed.get(key)
+
+    def partial_text(self, key):
+        return "".join(self.partial.get(key, []))
+
+    # Rewrite the journal without the chunk lines of finished sections
+    def compact(self):
+        with self.lock:
+            self.file.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, text in self.completed.items():
+                    f.write(json.dumps({"event": "section", "key": key, "text": text}, ensure_ascii=False) + "\n")
+                for key, chunks in self.partial.items():
+                    f.write(json.dumps({"event": "start", "key": key}) + "\n")
+                    for chunk in chunks:
+                        f.write(json.dumps({"event": "chunk", "key": key, "text": chunk}, ensure_ascii=False) + "\n")
+                for book, chapter_num in sorted(self.chapters, key=str):
+                    f.write(json.dumps({"event": "chapter", "chapter": chapter_num, "book": book}) + "\n")
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    # Forget everything (the GUI's Reset)
+    def clear(self):
+        with self.lock:
+            self.completed, self.partial, self.chapters = {}, {}, set()
+            self.file.close()
+            self.file = open(self.path, "w", encoding="utf-8")
+
+
+_open_journals = {}
+_open_lock = threading.Lock()
+
+
+def open_journal(temp_folder):
+    path = os.path.abspath(os.path.join(temp_folder, JOURNAL_FILE))
+    with _open_lock:
+        journal = _open_journals.get(path)
+        if journal is None:
+            journal = _open_journals[path] = GenerationJournal(temp_folder)
+        return journal
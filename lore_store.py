@@ -0,0 +1,269 @@
+import json
+import os
+import re
+import logging
+from story_memory import content_hash
+
+# World Building notes as an entity store. A world file is split into
+# entities (characters, places, items, ...) under heading lines such as
+# "## Name", "**Name**" or "Name:", each with optional "Type:" and "Aliases:"
+# lines; a JSON object of name -> details (the characters file format) works
+# too. An expansion prompt then carries only the entities the request names
+# plus the entities those mention, and the model's answer is merged back per
+# entity. The parsed store is kept in lore_store.json in the temp folder,
+# keyed by the hash of the text it was parsed from.
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE = "lore_store.json"
+KINDS = ("character", "place", "item", "faction", "lore")
+PREAMBLE_ID = "_preamble"  # Text before the first heading, rendered as-is
+MAX_NEIGHBOURS = 8  # Linked entities added besides the ones the prompt names
+MIN_ALIAS_CHARS = 3
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]*(?P<markdown>[^\n#]+?)[ \t]*#*|\*\*(?P<bold>[^*\n]+)\*\*:?|(?P<colon>[A-Z][\w'’-]*(?:[ \t]+[\w'’()-]+){0,4}):)[ \t]*$",
+    re.MULTILINE)
+META_PATTERN = re.compile(r"^[ \t]*(?P<key>type|kind|aliases|also known as)[ \t]*:[ \t]*(?P<value>.*)$", re.IGNORECASE)
+KIND_SUFFIX = re.compile(r"^(?P<name>.+?)\s*\((?P<kind>[^)]+)\)$")
+WORD_PATTERN = re.compile(r"\w+")
+
+FORMAT_INSTRUCTIONS = (
+    "Write every new or expanded entry under its own heading line \"## Name (type)\", where type is one of "
+    f"{', '.join(KINDS)}, optionally followed by an \"Aliases: ...\" line. Use the existing names for existing entries "
+    "and only write what is new about them."
+)
+
+
+def slug(name):
+    return "-".join(WORD_PATTERN.findall(name.lower())) or "entry"
+
+
+def _alias_key(alias):
+    return " ".join(WORD_PATTERN.findall(alias.lower()))
+
+
+class Entity:
+    def __init__(self, name, kind="lore", aliases=(), text="", entity_id=None):
+        self.id = entity_id or slug(name)
+        self.name = name
+        self.kind = kind
+        self.aliases = [alias for alias in aliases if alias and alias != name]
+        self.text = text.strip()
+        self.links = []  # Ids of other entities this one mentions
+
+    def names(self):
+        return [self.name] + self.aliases
+
+    def render(self):
+        if self.id == PREAMBLE_ID:
+            return self.text
+        lines = [f"## {self.name} ({self.kind})"]
+        if self.aliases:
+            lines.append(f"Aliases: {', '.join(self.aliases)}")
+        if self.text:
+            lines.append(self.text)
+        return "\n".join(lines)
+
+    def to_json(self):
+        return {"id": self.id, "name": self.name, "kind": self.kind, "aliases": self.aliases, "text": self.text, "links": self.links}
+
+    @classmethod
+    def from_json(cls, data):
+        entity = cls(data["name"], data.get("kind", "lore"), data.get("aliases", []), data.get("text", ""), data["id"])
+        entity.links = data.get("links", [])
+        return entity
+
+    def __repr__(self):
+        return f"Entity({self.id!r}, {self.kind!r}, {len(self.text.split())} words)"
+
+
+def _heading_entity(heading):
+    name, kind = heading.strip(), "lore"
+    match = KIND_SUFFIX.match(name)
+    if match and match.group("kind").strip().lower() in KINDS:
+        name, kind = match.group("name").strip(), match.group("kind").strip().lower()
+    return Entity(name, kind)
+
+
+def _apply_meta(entity, body):
+    lines = body.strip("\n").split("\n")
+    while lines:
+        match = META_PATTERN.match(lines[0])
+        if not match:
+            break
+        key, value = match.group("key").lower(), match.group("value").strip()
+        if key in ("type", "kind"):
+            entity.kind = value.lower() if value.lower() in KINDS else entity.kind
+        else:
+            entity.aliases += [alias.strip() for alias in value.split(",") if alias.strip() and alias.strip() != entity.name]
+        lines.pop(0)
+    entity.text = "\n".join(lines).strip()
+
+
+def _parse_json(data):
+    entities = []
+    for name, details in data.items():
+        if isinstance(details, dict):
+            aliases = [details["full_name"]] if isinstance(details.get("full_name"), str) else []
+            kind = str(details.get("type", "character" if "role" in details else "lore")).lower()
+            text = "\n".join(f"{key}: {', '.join(map(str, value)) if isinstance(value, list) else value}"
+                             for key, value in details.items() if key not in ("full_name", "type"))
+        else:
+            aliases, kind, text = [], "lore", str(details)
+        entities.append(Entity(str(name), kind if kind in KINDS else "lore", aliases, text))
+    return entities
+
+
+# Entities in order of appearance; text before the first heading becomes the
+# preamble entity
+def parse_entities(text):
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            data = json.loads(stripped)
+            if isinstance(data, dict):
+                return _parse_json(data)
+        except ValueError:
+            pass
+    matches = list(HEADING_PATTERN.finditer(text))
+    entities = []
+    preamble = text[:matches[0].start()] if matches else text
+    if preamble.strip():
+        entities.append(Entity("", "lore", (), preamble, PREAMBLE_ID))
+    for match, following in zip(matches, matches[1:] + [None]):
+        entity = _heading_entity(match.group("markdown") or match.group("bold") or match.group("colon"))
+        _apply_meta(entity, text[match.end():following.start() if following else len(text)])
+        entities.append(entity)
+    return entities
+
+
+class LoreStore:
+    def __init__(self, entities=()):
+        self.entities = {}  # id -> Entity, in document order
+        self.aliases = {}  # lowercased alias words -> entity id
+        self.longest_alias = 1
+        for entity in entities:
+            self._merge_entity(entity)
+        self._reindex()
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(parse_entities(text))
+
+    def __len__(self):
+        return len(self.entities)
+
+    def _reindex(self):
+        self._index_aliases()
+        for entity in self.entities.values():
+            entity.links = [entity_id for entity_id in self.mentions(entity.text) if entity_id != entity.id]
+
+    def _index_aliases(self):
+        self.aliases = {}
+        for entity in self.entities.values():
+            for alias in entity.names():
+                key = _alias_key(alias)
+                if len(key) >= MIN_ALIAS_CHARS:
+                    self.aliases.setdefault(key, entity.id)
+        self.longest_alias = max((len(key.split()) for key in self.aliases), default=1)
+
+    # Ids of entities named in text, in order of first mention. Looks up word
+    # n-grams, so the cost follows the length of text, not of the store.
+    def mentions(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        found = {}
+        for start in range(len(words)):
+            for size in range(min(self.longest_alias, len(words) - start), 0, -1):
+                entity_id = self.aliases.get(" ".join(words[start:start + size]))
+                if entity_id is not None:
+                    found.setdefault(entity_id, None)
+                    break
+        return list(found)
+
+    def _find(self, entity):
+        if entity.id in self.entities:
+            return self.entities[entity.id]
+        for alias in entity.names():
+            entity_id = self.aliases.get(_alias_key(alias))
+            if entity_id is not None:
+                return self.entities[entity_id]
+        return None
+
+    def _merge_entity(self, entity):
+        existing = self._find(entity)
+        if existing is None:
+            self.entities[entity.id] = entity
+            for alias in entity.names():
+                self.aliases.setdefault(_alias_key(alias), entity.id)
+            return entity
+        existing.aliases += [alias for alias in entity.names() if alias and alias not in existing.names()]
+        if existing.kind == "lore" and entity.kind != "lore":
+            existing.kind = entity.kind
+        known = {paragraph.strip() for paragraph in re.split(r"\n\s*\n", existing.text)}
+        new = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", entity.text) if paragraph.strip() and paragraph.strip() not in known]
+        if new:
+            existing.text = "\n\n".join(([existing.text] if existing.text else []) + new)
+        return existing
+
+    # Fold parsed entities (e.g. a model's answer) into the store; returns the
+    # ids of the entities that were added or extended
+    def merge(self, entities):
+        touched = [self._merge_entity(entity).id for entity in entities]
+        self._reindex()
+        return list(dict.fromkeys(touched))
+
+    # Merge a model's answer to prompt_text; an answer without headings
+    # extends the entry the request named, when it named exactly one
+    def merge_answer(self, answer, prompt_text):
+        entities = parse_entities(answer)
+        named = self.mentions(prompt_text)
+        if len(named) == 1 and len(entities) == 1 and entities[0].id == PREAMBLE_ID:
+            target = self.entities[named[0]]
+            entities = [Entity(target.name, target.kind, (), entities[0].text, target.id)]
+        return self.merge(entities)
+
+    # Entities named in the prompt, then up to MAX_NEIGHBOURS entities they link to
+    def select(self, prompt_text):
+        named = self.mentions(prompt_text)
+        neighbours = []
+        for entity_id in named:
+            for linked in self.entities[entity_id].links:
+                if linked not in named and linked not in neighbours and len(neighbours) < MAX_NEIGHBOURS:
+                    neighbours.append(linked)
+        return [self.entities[entity_id] for entity_id in named + neighbours]
+
+    def render(self, entities=None):
+        return "\n\n".join(entity.render() for entity in (self.entities.values() if entities is None else entities))
+
+    def to_json(self, source_hash):
+        return {"hash": source_hash, "entities": [entity.to_json() for entity in self.entities.values()]}
+
+
+# Parsed store for the given text, reusing lore_store.json in temp_folder when
+# it was built from the same text
+def load_store(text, temp_folder=None):
+    source_hash = content_hash(text)
+    path = os.path.join(temp_folder, STORE_FILE) if temp_folder else None
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("hash") == source_hash:
+                store = LoreStore()
+                store.entities = {entity["id"]: Entity.from_json(entity) for entity in data["entities"]}
+                store._index_aliases()  # Links were saved with the entities
+                return store
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable lore store {path}: {e}")
+    return LoreStore.from_text(text)
+
+
+# Write the store next to the text it renders to; returns that text
+def save_store(store, temp_folder):
+    text = store.render()
+    path = os.path.join(temp_folder, STORE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(store.to_json(content_hash(text)), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return text
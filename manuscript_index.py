@@ -0,0 +1,62 @@
+import re
+
+# Locates chapters inside a manuscript. The tool writes enhanced chapters
+# under "--- Chapter N: Title ---" markers; plain "Chapter N" headings are
+# recognised too. Spans are character offsets into the original text.
+
+CHAPTER_PATTERN = re.compile(r"^[ \t]*(?:---[ \t]*)?Chapter[ \t]+(\d+)\b[ \t:.\-]*(.*?)[ \t]*(?:---)?[ \t]*$", re.IGNORECASE | re.MULTILINE)
+
+
+class ChapterSpan:
+    def __init__(self, number, title, start, end):
+        self.number = number
+        self.title = title
+        self.start = start
+        self.end = end
+
+    def text(self, manuscript):
+        return manuscript[self.start:self.end].strip()
+
+    def __repr__(self):
+        return f"ChapterSpan({self.number}, {self.title!r}, {self.start}, {self.end})"
+
+
+# Marked chapters in order of appearance; text before the first marker is
+# returned as number 0 when it is not blank.
+def chapter_spans(text):
+    matches = list(CHAPTER_PATTERN.finditer(text))
+    spans = []
+    if matches and text[:matches[0].start()].strip():
+        spans.append(ChapterSpan(0, "", 0, matches[0].start()))
+    for match, following in zip(matches, matches[1:] + [None]):
+        spans.append(ChapterSpan(int(match.group(1)), match.group(2), match.start(), following.start() if following else len(text)))
+    return spans
+
+
+# Cut unmarked text into count spans of roughly equal word count, on paragraph boundaries
+def proportional_spans(text, count):
+    paragraphs = [m.span() for m in re.finditer(r"\S(?:.*?)(?=\n[ \t]*\n|\Z)", text, re.DOTALL)]
+    total = sum(len(text[a:b].split()) for a, b in paragraphs)
+    spans, start, words = [], 0, 0
+    for a, b in paragraphs:
+        words += len(text[a:b].split())
+        if len(spans) < count - 1 and words >= total * (len(spans) + 1) / count:
+            spans.append(ChapterSpan(len(spans) + 1, "", start, b))
+            start = b
+    spans.append(ChapterSpan(len(spans) + 1, "", start, len(text)))
+    while len(spans) < count:
+        spans.append(ChapterSpan(len(spans) + 1, "", len(text), len(text)))
+    return spans
+
+
+# Original text for each storyboard chapter number. Marked chapters are
+# matched by number, then by position when the numbers do not line up;
+# unmarked manuscripts are split proportionally.
+def spans_for_chapters(text, chapter_numbers):
+    marked = [span for span in chapter_spans(text) if span.number]
+    by_number = {span.number: span for span in marked}
+    if marked and all(number in by_number for number in chapter_numbers):
+        return {number: by_number[number] for number in chapter_numbers}
+    if len(marked) == len(chapter_numbers):
+        return dict(zip(chapter_numbers, marked))
+    return dict(zip(chapter_numbers, proportional_spans(text, len(chapter_numbers))))
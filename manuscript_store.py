@@ -0,0 +1,142 @@
+import bisect
+import json
+import mmap
+import os
+import shutil
+import threading
+import logging
+
+# The manuscript on disk instead of in the Story tab widget. The seed story
+# and every chapter are separate files (the chapter files are the engine's
+# temp_chapter_N.txt), listed in order in manuscript.json. Adding or
+# regenerating a chapter only rewrites the small index; parts are read
+# through mmap and the full book is written by streaming the parts into the
+# output file.
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "manuscript.json"
+SEED_FILE = "temp_seed_story.txt"
+SEED_ORDER = 0  # Parts are ordered by chapter number; the seed comes first
+SEPARATOR = "\n\n"
+COPY_BUFFER = 1024 * 1024
+
+
+class ManuscriptStore:
+    def __init__(self, temp_folder):
+        self.folder = temp_folder
+        self.path = os.path.join(temp_folder, INDEX_FILE)
+        self.lock = threading.RLock()
+        self.parts = []  # {"order", "name", "file", "bytes", "words"}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.parts = [part for part in json.load(f).get("parts", []) if os.path.exists(self._file(part))]
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable manuscript index {self.path}: {e}")
+                self.parts = []
+
+    def _file(self, part):
+        return os.path.join(self.folder, part["file"])
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"parts": self.parts}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.parts)
+
+    @property
+    def words(self):
+        return sum(part["words"] for part in self.parts)
+
+    # Start over from a seed story (the Story tab's loaded file)
+    def reset(self, seed_text=""):
+        with self.lock:
+            self.parts = []
+            if seed_text.strip():
+                with open(os.path.join(self.folder, SEED_FILE), "w", encoding="utf-8") as f:
+                    f.write(seed_text.strip())
+                self._add(SEED_ORDER, "Chapter 1", SEED_FILE)
+            self._save()
+
+    # Register a chapter file written elsewhere (finish_chapter); a chapter
+    # with the same number is replaced. Earlier parts are not touched.
+    def add_chapter(self, number, path):
+        with self.lock:
+            self._add(number, f"Chapter {number}", os.path.relpath(os.path.abspath(path), os.path.abspath(self.folder)))
+            self._save()
+
+    def _add(self, order, name, file_name):
+        path = os.path.join(self.folder, file_name)
+        with open(path, "r", encoding="utf-8") as f:
+            words = sum(len(line.split()) for line in f)
+        part = {"order": order, "name": name, "file": file_name, "bytes": os.path.getsize(path), "words": words}
+        self.parts = [existing for existing in self.parts if existing["order"] != order]
+        self.parts.insert(bisect.bisect([existing["order"] for existing in self.parts], order), part)
+
+    def _read_bytes(self, part):
+        if part["bytes"] == 0:
+            return b""
+        with open(self._file(part), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return data[:part["bytes"]]
+
+    # The seed story's file, or None when the store has no seed
+    def seed_path(self):
+        with self.lock:
+            seed = next((part for part in self.parts if part["order"] == SEED_ORDER), None)
+        return self._file(seed) if seed else None
+
+    def seed_text(self):
+        with self.lock:
+            seed = next((part for part in self.parts if part["order"] == SEED_ORDER), None)
+        return self.read_part(seed) if seed else ""
+
+    # Text of each chapter part by number, or None unless every number has a
+    # part. The engine's chapters carry no "Chapter N" markers, so this is how
+    # they are told apart from each other and from the seed.
+    def chapter_texts(self, numbers):
+        with self.lock:
+            by_number = {part["order"]: part for part in self.parts if part["order"] != SEED_ORDER}
+        if not numbers or any(number not in by_number for number in numbers):
+            return None
+        return {number: self.read_part(by_number[number]).strip() for number in numbers}
+
+    def read_part(self, part):
+        return self._read_bytes(part).decode("utf-8")
+
+    def text(self):
+        with self.lock:
+            parts = list(self.parts)
+        return SEPARATOR.join(self.read_part(part) for part in parts)
+
+    # Write the whole book to path by streaming each part, without holding it in memory
+    def assemble(self, path):
+        with self.lock:
+            parts = list(self.parts)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            for number, part in enumerate(parts):
+                if number:
+                    out.write(SEPARATOR.encode("utf-8"))
+                with open(self._file(part), "rb") as f:
+                    shutil.copyfileobj(f, out, COPY_BUFFER)
+        os.replace(tmp_path, path)
+        logger.info(f"Assembled {len(parts)} parts ({self.words} words) into {path}")
+        return path
+
+
+_open_stores = {}
+_open_lock = threading.Lock()
+
+
+def open_store(temp_folder):
+    path = os.path.abspath(temp_folder)
+    with _open_lock:
+        store = _open_stores.get(path)
+        if store is None:
+            store = _open_stores[path] = ManuscriptStore(temp_folder)
+        return store
@@ -0,0 +1,117 @@
+import contextlib
+import logging
+import threading
+import time
+import requests
+import ollama_client
+from prompt_builder import KEEP_ALIVE
+
+# Keeps the model a run needs in memory. Picking a model preloads it (an
+# empty /api/generate), so the first section does not wait for weights to
+# load; a run pins it with a long keep_alive, which every request of the run
+# repeats because Ollama resets the unload timer per request, and releases it
+# back to the normal KEEP_ALIVE afterwards. The pin is finite so a run that
+# never releases it (window closed mid-run, crash) frees the memory anyway. Switching between models is
+# logged, since each switch can make Ollama unload one to load the other.
+
+logger = logging.getLogger(__name__)
+
+PIN_KEEP_ALIVE = "2h"  # Refreshed by every request of the run; outlasts the longest single request
+LOAD_TIMEOUT = (5.0, 600.0)  # A large model can take minutes to read from disk
+PS_TIMEOUT = (5.0, 5.0)
+
+
+class ModelLifecycle:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pins = {}  # model -> number of runs holding it
+        self.last_model = None
+
+    def preload(self, model, keep_alive=KEEP_ALIVE, status=None):
+        started = time.perf_counter()
+        try:
+            ollama_client.get_client().load_model(model, keep_alive, timeout=LOAD_TIMEOUT)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Could not preload {model}: {e}")
+            return False
+        message = f"{model} loaded in {time.perf_counter() - started:.1f}s"
+        logger.info(message)
+        if status:
+            status(message)
+        return True
+
+    def preload_async(self, model, status=None):
+        thread = threading.Thread(target=self.preload, args=(model, KEEP_ALIVE, status), daemon=True)
+        thread.start()
+        return thread
+
+    def _loaded(self):
+        try:
+            return ollama_client.get_client().loaded_models(timeout=PS_TIMEOUT)
+        except (requests.RequestException, ValueError):
+            return None
+
+    # Warn before a run whose model differs from the one in use; returns the
+    # warning, or None
+    def check_switch(self, model, status=None):
+        with self.lock:
+            others = [name for name in self.pins if name != model]
+            previous = self.last_model
+            self.last_model = model
+        if others:
+            warning = (f"{model} requested while {', '.join(others)} is pinned by another run; "
+                       f"alternating models makes Ollama reload them")
+        elif previous and previous != model and ollama_client.has_model(self._loaded() or (), previous):
+            warning = (f"Switching from {previous} to {model}; if both do not fit in memory, "
+                       f"Ollama unloads {previous} and switching back will reload it")
+        else:
+            return None
+        logger.warning(warning)
+        if status:
+            status(warning)
+        return warning
+
+    @contextlib.contextmanager
+    def pinned(self, model, status=None):
+        self.check_switch(model, status)
+        client = ollama_client.get_client()
+        with self.lock:
+            first = not self.pins.get(model)
+            self.pins[model] = self.pins.get(model, 0) + 1
+            client.pinned[model] = PIN_KEEP_ALIVE
+        try:
+            if first:
+                self.preload(model, PIN_KEEP_ALIVE)  # The run reports connection errors itself
+            yield
+        finally:
+            with self.lock:
+                self.pins[model] -= 1
+                last = not self.pins[model]
+                if last:
+                    del self.pins[model]
+                    client.pinned.pop(model, None)
+            if last:
+                self.release(model)
+
+    # Back to the normal idle timeout; a model that is no longer loaded is
+    # left alone rather than loaded again
+    def release(self, model):
+        loaded = self._loaded()
+        if loaded is None or not ollama_client.has_model(loaded, model):
+            return
+        try:
+            ollama_client.get_client().load_model(model, KEEP_ALIVE, timeout=PS_TIMEOUT)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Could not release {model}: {e}")
+
+
+_lifecycle = None
+_lifecycle_lock = threading.Lock()
+
+
+def get_lifecycle():
+    global _lifecycle
+    with _lifecycle_lock:
+        if _lifecycle is None:
+            _lifecycle = ModelLifecycle()
+        return _lifecycle
@@ -0,0 +1,456 @@
+import json
+import os
+import random
+import re
+import socket
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled HTTP client for every Ollama call. A single requests.Session keeps
+# keep-alive connections open between section requests, every call gets the
+# same connect/read deadlines, and connection failures are retried with
+# jittered exponential backoff.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+RETRY_STATUSES = (500, 502, 503, 504)
+HEALTH_TTL = 30.0  # Seconds before a healthy pool host's model list is re-read
+DOWN_RETRY = 10.0  # Seconds before a failed pool host is probed again
+HEALTH_TIMEOUT = 5.0
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+# Shared between a UI thread and a worker: cancel() marks the run cancelled and
+# closes every stream currently registered, which unblocks the reading thread
+# immediately instead of waiting for the next token.
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.responses = set()
+
+    def cancel(self):
+        self.event.set()
+        with self.lock:
+            responses = list(self.responses)
+        for response in responses:
+            _abort_response(response)
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise GenerationCancelled("Generation cancelled.")
+
+    def register(self, response):
+        with self.lock:
+            self.responses.add(response)
+        if self.event.is_set():
+            _abort_response(response)
+
+    def unregister(self, response):
+        with self.lock:
+            self.responses.discard(response)
+
+
+# Stops a stream once it has passed a word ceiling. Words are counted
+# incrementally per chunk (a word split across chunks is counted once), and
+# after the ceiling the stream is cut right after the next sentence end, or
+# `slack` words later if no sentence ends. start_words counts text already
+# written, e.g. by an earlier attempt at the same section.
+class WordCeiling:
+    SENTENCE_END = re.compile(r"[.!?][\"'”’)\]]*(?=\s|$)")
+
+    def __init__(self, ceiling, start_words=0, slack=80):
+        self.ceiling = ceiling
+        self.slack = slack
+        self.words = start_words
+        self.in_word = False
+        self.stopped = False
+
+    # Settings that shape where the stream is cut, for response cache keys;
+    # taken before the stream starts
+    def cache_key(self):
+        return {"ceiling": self.ceiling, "slack": self.slack, "start_words": self.words}
+
+    # Returns (text to keep, stop)
+    def feed(self, chunk):
+        if self.words >= self.ceiling:
+            match = self.SENTENCE_END.search(chunk)
+            if match:
+                self.stopped = True
+                return chunk[:match.end()], True
+        self.words += len(chunk.split()) - (1 if self.in_word and chunk[:1].strip() else 0)
+        self.in_word = bool(chunk[-1:].strip())
+        if self.words >= self.ceiling + self.slack:
+            self.stopped = True
+            return chunk, True
+        return chunk, False
+
+
+# Shut the socket down so a thread blocked reading the stream returns at once;
+# response.close() alone waits for the server's next bytes.
+def _abort_response(response):
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+# Accepts the same forms as Ollama's OLLAMA_HOST ("host:port", "http://host:port")
+def normalize_base_url(base_url):
+    base_url = base_url.strip().rstrip("/")
+    if "://" not in base_url:
+        base_url = f"http://{base_url}"
+    return base_url
+
+
+class OllamaClient:
+    def __init__(self, base_url=None, connect_timeout=5.0, read_timeout=300.0, max_retries=3, backoff_base=1.0, backoff_max=30.0, pool_size=16):
+        self.base_url = normalize_base_url(base_url or os.environ.get("OLLAMA_HOST") or DEFAULT_BASE_URL)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout  # Max silence between streamed bytes, not total duration
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = None  # Optional response_cache.ResponseCache ("reuse cached" mode)
+        self.metrics = None  # Optional run_metrics.MetricsStore receiving every final line
+        self.pinned = {}  # model -> keep_alive sent with its requests while a run holds it (model_lifecycle)
+        self.unpinned_warned = set()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    # Full jitter: sleep a random time up to the exponential cap
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request(self, method, path, timeout=None, **kwargs):
+        url = f"{self.base_url}{path}"
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    response.close()
+                    raise requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                response.raise_for_status()
+                return response
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or (e.response is not None and e.response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"Ollama {method} {path} failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def list_models(self, timeout=None):
+        response = self._request("GET", "/api/tags", timeout=timeout)
+        return [model["name"] for model in response.json().get("models", [])]
+
+    # Models currently in memory (/api/ps)
+    def loaded_models(self, timeout=None):
+        response = self._request("GET", "/api/ps", timeout=timeout)
+        return [model["name"] for model in response.json().get("models", [])]
+
+    # An empty prompt loads the model without generating and sets how long
+    # Ollama keeps it: a duration such as "30m", -1 to keep it until told
+    # otherwise, 0 to unload it now
+    def load_model(self, model, keep_alive, timeout=None):
+        payload = {"model": model, "prompt": "", "keep_alive": keep_alive, "stream": False}
+        self._request("POST", "/api/generate", json=payload, timeout=timeout).close()
+
+    # Stream /api/generate. Returns (text, final) where final is the closing
+    # NDJSON object (done=True) carrying Ollama's timing counters, or {}.
+    # on_token(chunk) is called for every streamed piece of text. When a cache
+    # is attached, identical requests are answered from it and complete
+    # responses are stored (see complete_response). A stop controller's
+    # cache_key() is part of the key, so a different ceiling misses. A CancelToken aborts the stream mid-flight
+    # with GenerationCancelled. A stop controller (e.g. WordCeiling) may end
+    # the stream early; the connection is then dropped so the server stops
+    # generating, and final holds client-side estimates of Ollama's counters
+    # (chunks counted as tokens) with done_reason "stop_controller". tags (e.g.
+    # chapter, section, attempt) label the request in the metrics store.
+    def generate(self, payload, on_token=None, cancel=None, stop=None, tags=None):
+        payload = dict(payload, stream=True)
+        if cancel:
+            cancel.check()
+        if self.pinned:
+            self._apply_pin(payload)
+        cache_payload = payload
+        if self.cache is not None and stop is not None:
+            cache_payload = dict(payload, stop_controller=stop.cache_key()) if hasattr(stop, "cache_key") else None
+        if cache_payload is not None and self.cache is not None:
+            cached = self.cache.get(cache_payload)
+            if cached is not None:
+                text, final = cached
+                final = dict(final, cached=True)
+                if on_token and text:
+                    on_token(text)
+                if self.metrics is not None:
+                    self.metrics.record(payload.get("model"), final, tags)
+                return text, final
+        text, final = self._stream(payload, on_token, cancel, stop)
+        if cache_payload is not None and self.cache is not None and complete_response(final):
+            self.cache.put(cache_payload, text, final)
+        if self.metrics is not None:
+            self.metrics.record(payload.get("model"), final, tags)
+        return text, final
+
+    # A pinned model's requests must carry its keep_alive too: Ollama resets the
+    # unload timer to whatever each request sends
+    def _apply_pin(self, payload):
+        model = payload.get("model")
+        if model in self.pinned:
+            payload["keep_alive"] = self.pinned[model]
+        elif model not in self.unpinned_warned:
+            self.unpinned_warned.add(model)
+            logger.warning(f"Request for {model} while {', '.join(self.pinned)} is pinned for this run; "
+                           f"alternating models makes Ollama reload them (see load_duration in run_metrics.jsonl)")
+
+    def _stream(self, payload, on_token, cancel, stop):
+        started = time.perf_counter()
+        response = self._request("POST", "/api/generate", json=payload, stream=True)
+        pieces = []
+        if cancel:
+            cancel.register(response)
+        try:
+            with response:
+                final = self._read_stream(response, pieces, on_token, cancel, stop, started)
+        except Exception:
+            if cancel:
+                cancel.check()
+            raise
+        finally:
+            if cancel:
+                cancel.unregister(response)
+        return "".join(pieces), final
+
+    def _read_stream(self, response, pieces, on_token, cancel, stop=None, started=None):
+        final = {}
+        first_token = None
+        tokens = 0
+        for line in response.iter_lines():
+            if cancel:
+                cancel.check()
+            if not line:
+                continue
+            json_line = json.loads(line.decode("utf-8"))
+            if "error" in json_line:
+                raise ValueError(f"Ollama error: {json_line['error']}")
+            chunk = json_line.get("response", "")
+            stopped = False
+            if chunk and stop is not None:
+                chunk, stopped = stop.feed(chunk)
+            if chunk:
+                tokens += 1
+                first_token = first_token or time.perf_counter()
+                pieces.append(chunk)
+                if on_token:
+                    on_token(chunk)
+            if stopped:
+                _abort_response(response)
+                now = time.perf_counter()
+                started = started or first_token
+                return {"done_reason": "stop_controller", "estimated": True, "eval_count": tokens,
+                        "total_duration": int((now - started) * 1e9), "prompt_eval_duration": int((first_token - started) * 1e9),
+                        "eval_duration": int((now - first_token) * 1e9)}
+            if json_line.get("done"):
+                final = json_line
+        return final
+
+
+# Responses the response cache may store: finished by the model, or by a stop
+# controller; not cut short by num_predict, which is not part of the key
+def complete_response(final):
+    if final.get("done_reason") == "stop_controller":
+        return True
+    return bool(final.get("done")) and final.get("done_reason") != "length"
+
+
+def has_model(models, name):
+    return name in models or (":" not in name and f"{name}:latest" in models)
+
+
+class _PoolHost:
+    def __init__(self, client):
+        self.client = client
+        self.models = set()
+        self.healthy = True
+        self.checked = None  # time.monotonic() of the last /api/tags probe
+        self.outstanding = 0
+
+
+# Several Ollama servers behind the OllamaClient interface. Hosts are probed
+# with /api/tags (every HEALTH_TTL seconds, failed ones every DOWN_RETRY);
+# each request goes to the healthy host with the fewest requests in flight
+# among those that have the model, and moves to another host when its host
+# fails before streaming anything. Cache and metrics apply to the pool.
+class OllamaPool(OllamaClient):
+    def __init__(self, base_urls, **kwargs):
+        super().__init__(base_urls[0], **kwargs)
+        self.base_url = ",".join(normalize_base_url(url) for url in base_urls)
+        self.lock = threading.Lock()
+        # Members fail fast; the pool does the retrying, on other hosts first
+        self.hosts = [_PoolHost(OllamaClient(url, **dict(kwargs, max_retries=0))) for url in base_urls]
+
+    def close(self):
+        for host in self.hosts:
+            host.client.close()
+        super().close()
+
+    def _probe(self, host, timeout=None):
+        try:
+            host.models = set(host.client.list_models(timeout=timeout or (self.connect_timeout, HEALTH_TIMEOUT)))
+            if not host.healthy:
+                logger.info(f"Ollama host {host.client.base_url} is back ({len(host.models)} models)")
+            host.healthy = True
+        except (requests.RequestException, ValueError) as e:
+            if host.healthy:
+                logger.warning(f"Ollama host {host.client.base_url} unavailable: {e}")
+            host.healthy = False
+        host.checked = time.monotonic()
+
+    def refresh(self, force=False, timeout=None):
+        now = time.monotonic()
+        stale = [host for host in self.hosts
+                 if force or host.checked is None or now - host.checked > (HEALTH_TTL if host.healthy else DOWN_RETRY)]
+        if stale:
+            with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+                list(executor.map(lambda host: self._probe(host, timeout), stale))
+
+    def list_models(self, timeout=None):
+        self.refresh(force=True, timeout=timeout)
+        healthy = [host for host in self.hosts if host.healthy]
+        if not healthy:
+            raise requests.ConnectionError(f"No Ollama host reachable in {self.base_url}")
+        return sorted(set().union(*(host.models for host in healthy)))
+
+    def loaded_models(self, timeout=None):
+        self.refresh()
+        loaded = set()
+        for host in self.hosts:
+            if host.healthy:
+                try:
+                    loaded.update(host.client.loaded_models(timeout=timeout))
+                except (requests.RequestException, ValueError):
+                    pass
+        return sorted(loaded)
+
+    # Load on every healthy host that has the model, since any of them may
+    # be picked for the next request
+    def load_model(self, model, keep_alive, timeout=None):
+        self.refresh()
+        hosts = [host for host in self.hosts if host.healthy and has_model(host.models, model)]
+        if not hosts:
+            raise requests.ConnectionError(f"No Ollama host in {self.base_url} has {model}")
+        with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+            list(executor.map(lambda host: host.client.load_model(model, keep_alive, timeout), hosts))
+
+    def status(self):
+        return [{"url": host.client.base_url, "healthy": host.healthy, "outstanding": host.outstanding, "models": sorted(host.models)}
+                for host in self.hosts]
+
+    def _pick(self, model, exclude):
+        self.refresh()
+        with self.lock:
+            candidates = [host for host in self.hosts if host.healthy and host not in exclude]
+            with_model = [host for host in candidates if has_model(host.models, model)]
+            if candidates and not with_model:
+                logger.warning(f"No healthy Ollama host lists {model}; trying one anyway")
+            choices = with_model or candidates
+            if not choices:
+                return None
+            host = min(choices, key=lambda host: host.outstanding)
+            host.outstanding += 1
+            return host
+
+    def _stream(self, payload, on_token, cancel, stop):
+        model = payload.get("model")
+        tried = []
+        attempt = 0
+        while True:
+            host = self._pick(model, tried)
+            if host is None:
+                if attempt >= self.max_retries:
+                    raise requests.ConnectionError(f"No Ollama host in {self.base_url} could serve {model}")
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"All Ollama hosts failed; retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                self.refresh(force=True)
+                tried = []
+                continue
+            streamed = False
+
+            def relay(chunk):
+                nonlocal streamed
+                streamed = True
+                if on_token:
+                    on_token(chunk)
+
+            try:
+                text, final = host.client._stream(payload, relay, cancel, stop)
+                return text, dict(final, host=host.client.base_url)
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+                if streamed or (status is not None and status not in RETRY_STATUSES and status != 404):
+                    raise  # Text already reached the caller, or the request itself is bad
+                if status != 404:
+                    host.healthy = False
+                    host.checked = time.monotonic()
+                tried.append(host)
+                logger.warning(f"Ollama host {host.client.base_url} failed for {model} ({e}); trying another host")
+            finally:
+                with self.lock:
+                    host.outstanding -= 1
+
+
+_default_client = None
+
+
+# OLLAMA_HOSTS (comma-separated) selects a pool; otherwise OLLAMA_HOST or localhost
+def _make_client(base_url=None, **kwargs):
+    base_url = base_url or os.environ.get("OLLAMA_HOSTS") or os.environ.get("OLLAMA_HOST")
+    urls = [url.strip() for url in (base_url or "").split(",") if url.strip()]
+    if len(urls) > 1:
+        return OllamaPool(urls, **kwargs)
+    return OllamaClient(urls[0] if urls else None, **kwargs)
+
+
+def get_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = _make_client()
+    return _default_client
+
+
+# Replace the shared client, e.g. to point every call at another host or at a
+# comma-separated list of hosts
+def configure(**kwargs):
+    global _default_client
+    if _default_client is not None:
+        _default_client.close()
+    _default_client = _make_client(**kwargs)
+    return _default_client
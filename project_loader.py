@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+
+# Parsed project inputs (storyboard, characters, instructions, other info).
+# Every generate/enhance click used to re-read and re-parse the selected
+# files; they are now parsed once and kept until the file changes. A changed
+# mtime or size triggers a re-read, and the content hash decides whether the
+# parsed data is still good (a save without edits keeps it). JSON inputs are
+# checked against the schema the engine relies on when they are parsed, so a
+# bad storyboard fails at load time instead of halfway through a chapter.
+# Cached data is shared between projects and must be treated as read-only.
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectError(ValueError):
+    pass
+
+
+class _Entry:
+    def __init__(self, signature, digest, data):
+        self.signature = signature
+        self.digest = digest
+        self.data = data
+
+
+_cache = {}  # (kind, absolute path) -> _Entry
+_cache_lock = threading.Lock()
+stats = {"hits": 0, "reparsed": 0, "rehashed": 0}
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Parsed contents of path, re-read only when its mtime or size changed and
+# re-parsed only when its content hash changed
+def _load(kind, path, parse):
+    key = (kind, os.path.abspath(path))
+    signature = _signature(path)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.signature == signature:
+            stats["hits"] += 1
+            return entry.data
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.digest == digest:
+            stats["rehashed"] += 1
+            entry.signature = signature
+            return entry.data
+    try:
+        data = parse(raw.decode("utf-8"))
+    except UnicodeDecodeError as e:
+        raise ProjectError(f"{path} is not UTF-8 text: {e}") from e
+    except ProjectError as e:
+        raise ProjectError(f"{path}: {e}") from e
+    with _cache_lock:
+        _cache[key] = _Entry(signature, digest, data)
+        stats["reparsed"] += 1
+    return data
+
+
+def _parse_json(text):
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise ProjectError(f"invalid JSON ({e})") from e
+
+
+def _check_list(value, where, item_type, type_name):
+    if not isinstance(value, list) or not all(isinstance(item, item_type) for item in value):
+        raise ProjectError(f"{where} must be a list of {type_name}")
+
+
+def validate_storyboard(data):
+    if not isinstance(data, dict) or not isinstance(data.get("chapters"), list) or not data["chapters"]:
+        raise ProjectError('storyboard must be an object with a non-empty "chapters" list')
+    for i, chapter in enumerate(data["chapters"], 1):
+        where = f"chapter {i}"
+        if not isinstance(chapter, dict):
+            raise ProjectError(f"{where} must be an object")
+        if "number" in chapter and (not isinstance(chapter["number"], int) or isinstance(chapter["number"], bool)):
+            raise ProjectError(f'{where}: "number" must be an integer')
+        for field in ("title", "setting", "style", "goal"):
+            if field in chapter and not isinstance(chapter[field], str):
+                raise ProjectError(f'{where}: "{field}" must be a string')
+        if "characters_present" in chapter:
+            _check_list(chapter["characters_present"], f'{where}: "characters_present"', str, "names")
+        _check_list(chapter.get("sections", []), f'{where}: "sections"', dict, "objects")
+        for j, section in enumerate(chapter.get("sections", []), 1):
+            word_count = section.get("word_count", 400)
+            if not isinstance(word_count, int) or isinstance(word_count, bool) or word_count <= 0:
+                raise ProjectError(f'{where}, section {j}: "word_count" must be a positive integer')
+            for field in ("task", "instructions"):
+                if field in section and not isinstance(section[field], str):
+                    raise ProjectError(f'{where}, section {j}: "{field}" must be a string')
+    return data
+
+
+def validate_characters(data):
+    if not isinstance(data, dict):
+        raise ProjectError("characters must be an object of name -> details")
+    return data
+
+
+def load_storyboard(path):
+    return _load("storyboard", path, lambda text: validate_storyboard(_parse_json(text)))
+
+
+def load_characters(path):
+    return _load("characters", path, lambda text: validate_characters(_parse_json(text)))
+
+
+def load_text(path):
+    return _load("text", path, lambda text: text.strip())
+
+
+# Names in characters_present that match no entry of the characters file
+def unknown_characters(storyboard_data, characters_data):
+    unknown = []
+    for chapter in storyboard_data.get("chapters", []):
+        for name in chapter.get("characters_present", []):
+            if _find_character(characters_data, name) is None and name not in unknown:
+                unknown.append(name)
+    return unknown
+
+
+# Key of the entry for a storyboard name: the key itself, its full_name, or
+# the first word of either (storyboards often use first names)
+def _find_character(characters_data, name):
+    wanted = name.strip().lower()
+    for key, details in characters_data.items():
+        names = [key] + ([details["full_name"]] if isinstance(details, dict) and isinstance(details.get("full_name"), str) else [])
+        if any(wanted in (candidate.lower(), candidate.lower().split()[0] if candidate.split() else "") for candidate in names):
+            return key
+    return None
+
+
+# The characters a chapter lists in characters_present, in the file's order.
+# Chapters without the field (or naming nobody on file) get every character.
+def chapter_characters(characters_data, chapter):
+    keys = {_find_character(characters_data, name) for name in chapter.get("characters_present", [])} - {None}
+    if not keys:
+        return characters_data
+    return {key: details for key, details in characters_data.items() if key in keys}
@@ -0,0 +1,189 @@
+import json
+import math
+import threading
+
+# Prompt layout for Ollama's prompt cache. The runner keeps the KV state of
+# the last prompt per slot and only re-evaluates tokens after the longest
+# common prefix, so everything that does not change between requests goes
+# first and is rendered byte-for-byte the same way every time; the
+# request-specific text always comes last.
+
+KEEP_ALIVE = "30m"  # Keep the model (and its cached prefix) loaded between sections
+DEFAULT_MAX_CTX = 32768  # Largest num_ctx a request may ask for
+MIN_CTX = 2048
+TOKENS_PER_WORD = 1.4  # Starting estimate for generated prose, refined from eval_count
+PREDICT_HEADROOM = 1.25  # num_predict allowance above the requested word count
+REPLY_RESERVE = 2048  # Tokens reserved for replies without a word target
+PROMPT_MARGIN = 1.15  # estimate_tokens() is a guess; never let Ollama truncate the prompt
+
+
+# Rough prompt size; English prose runs about four characters per token
+def estimate_tokens(text):
+    return len(text) // 4 + 1 if text else 0
+
+
+# Deterministic JSON rendering for prompt blocks; compact, since indentation
+# only adds whitespace tokens
+def stable_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+# Size of the same data the way it used to be embedded (indent=2), for reports
+def indented_tokens(data):
+    return estimate_tokens(json.dumps(data, indent=2, ensure_ascii=False))
+
+
+class PromptAssembler:
+    def __init__(self, blocks=None, trims=None):
+        self.blocks = list(blocks or [])
+        self.trims = list(trims or [None] * len(self.blocks))  # Per block: None or trim priority
+
+    # Append an invariant block; empty bodies are skipped so the layout never
+    # depends on truthiness tricks inside a single f-string. Blocks added with
+    # a trim priority may be shortened by fit(), lowest priority first.
+    def add(self, heading, body, trim=None):
+        if body:
+            body = body.strip("\n")
+            self.blocks.append(f"{heading}:\n{body}" if heading else body)
+            self.trims.append(None if trim is None else (trim, len(heading) + 2 if heading else 0))
+        return self
+
+    # A copy with more invariant blocks, e.g. book-level prefix -> chapter-level prefix
+    def extend(self):
+        return PromptAssembler(self.blocks, self.trims)
+
+    # A copy whose prefix fits in budget_tokens. Trimmable blocks lose their
+    # beginning (the end of a story is what the next text continues from) and
+    # are dropped entirely when too little of them would be left.
+    def fit(self, budget_tokens):
+        excess_chars = (estimate_tokens(self.prefix) - budget_tokens) * 4
+        if excess_chars <= 0:
+            return self
+        fitted = self.extend()
+        order = sorted((trim[0], i) for i, trim in enumerate(self.trims) if trim is not None)
+        for _, i in order:
+            if excess_chars <= 0:
+                break
+            heading_len = self.trims[i][1]
+            block = fitted.blocks[i]
+            body_len = len(block) - heading_len
+            if body_len - excess_chars < 200:
+                fitted.blocks[i] = block[:heading_len] + "[omitted]"
+                excess_chars -= body_len
+            else:
+                fitted.blocks[i] = block[:heading_len] + "[...]" + block[heading_len + excess_chars:]
+                excess_chars = 0
+        return fitted
+
+    @property
+    def prefix(self):
+        return "\n\n".join(self.blocks) + "\n\n" if self.blocks else ""
+
+    def build(self, suffix):
+        return self.prefix + suffix
+
+
+# Collects prompt sizes and Ollama's prompt_eval_count to show how many prompt
+# tokens the server did not have to evaluate thanks to prefix reuse.
+class PromptEvalTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, prompt, final):
+        count = final.get("prompt_eval_count") if final else None
+        if count is None or final.get("cached"):
+            return
+        with self.lock:
+            self.records.append((len(prompt), count))
+
+    # The highest tokens-per-char ratio seen is taken to be a cold (uncached)
+    # evaluation and used to estimate what every prompt would cost uncached.
+    def summary(self):
+        with self.lock:
+            records = list(self.records)
+        if not records:
+            return None
+        ratio = max(count / chars for chars, count in records if chars) if any(chars for chars, _ in records) else 0
+        evaluated = sum(count for _, count in records)
+        estimated = int(sum(chars * ratio for chars, _ in records))
+        saved = max(0, estimated - evaluated)
+        return {
+            "requests": len(records),
+            "prompt_eval_count": evaluated,
+            "estimated_uncached": estimated,
+            "saved_tokens": saved,
+            "saved_pct": round(100.0 * saved / estimated, 1) if estimated else 0.0,
+        }
+
+    def describe(self):
+        summary = self.summary()
+        if not summary:
+            return "No prompt_eval_count reported."
+        return (f"Prompt eval: {summary['prompt_eval_count']} tokens over {summary['requests']} requests "
+                f"(~{summary['estimated_uncached']} without prefix reuse, saved ~{summary['saved_tokens']} / {summary['saved_pct']}%)")
+
+
+# Builds /api/generate bodies with the sampling settings and limits in
+# Ollama's options object. num_predict comes from the requested word count and
+# a tokens-per-word ratio calibrated from eval_count; num_ctx is the smallest
+# power of two that holds the prompt and the reply, so consecutive requests of
+# similar size share a runner instead of forcing a model reload.
+class TokenBudget:
+    def __init__(self, max_ctx=DEFAULT_MAX_CTX):
+        self.max_ctx = max_ctx
+        self.lock = threading.Lock()
+        self.tokens_per_word = TOKENS_PER_WORD
+        self.samples = 0
+
+    # Cached responses count too: they carry the eval_count of the run that
+    # stored them, so a re-run calibrates the same way, computes the same
+    # num_predict and hits the response cache for every request
+    def observe(self, text, final):
+        count = final.get("eval_count") if final else None
+        words = len(text.split())
+        if not count or words < 50:
+            return
+        with self.lock:
+            self.samples += 1
+            weight = max(0.1, 1.0 / self.samples)
+            self.tokens_per_word += weight * (count / words - self.tokens_per_word)
+
+    def predict_tokens(self, words):
+        return int(math.ceil(words * self.tokens_per_word * PREDICT_HEADROOM)) + 32
+
+    def context_size(self, prompt_tokens, reply_tokens):
+        needed = int(prompt_tokens * PROMPT_MARGIN) + reply_tokens
+        num_ctx = MIN_CTX
+        while num_ctx < needed and num_ctx < self.max_ctx:
+            num_ctx *= 2
+        return min(num_ctx, self.max_ctx)
+
+    # Tokens left for the prompt once a reply of reply_words is reserved
+    def prompt_budget(self, reply_words=None):
+        reply = self.predict_tokens(reply_words) if reply_words else REPLY_RESERVE
+        return int((self.max_ctx - reply) / PROMPT_MARGIN)
+
+    def request(self, model, prompt, words=None, temperature=0.7, top_p=0.85, num_ctx=None, **extra):
+        options = {"temperature": temperature, "top_p": top_p}
+        reply_tokens = REPLY_RESERVE
+        if words:
+            reply_tokens = options["num_predict"] = self.predict_tokens(words)
+        options["num_ctx"] = num_ctx or self.context_size(estimate_tokens(prompt), reply_tokens)
+        return dict({"model": model, "prompt": prompt, "options": options, "keep_alive": KEEP_ALIVE}, **extra)
+
+
+_default_budget = None
+
+
+def get_budget():
+    global _default_budget
+    if _default_budget is None:
+        _default_budget = TokenBudget()
+    return _default_budget
+
+
+def configure_budget(**kwargs):
+    global _default_budget
+    _default_budget = TokenBudget(**kwargs)
+    return _default_budget
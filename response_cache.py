@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+# Content-addressed cache of finished /api/generate responses, stored as
+# SQLite in the temp folder. The key is a hash of everything that shapes the
+# output (model, prompt, options, ...), so re-running a storyboard or a
+# downstream step with identical inputs is answered from disk. Least recently
+# used rows are evicted once the cache grows past max_bytes.
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "response_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+IGNORED_KEYS = ("stream", "keep_alive")  # Transport settings that do not change the text
+# Limits TokenBudget derives from a running tokens-per-word average, which
+# differs between runs and with request order. The requested word count is
+# already in the key through the prompt and the word ceiling; responses the
+# limit cut short (done_reason "length") are not stored.
+IGNORED_OPTIONS = ("num_predict", "num_ctx")
+
+
+def request_key(payload):
+    material = {k: v for k, v in payload.items() if k not in IGNORED_KEYS}
+    if isinstance(material.get("options"), dict):
+        material["options"] = {k: v for k, v in material["options"].items() if k not in IGNORED_OPTIONS}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, final TEXT, "
+            "size INTEGER, created REAL, last_access REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # Returns (text, final) or None
+    def get(self, payload):
+        key = request_key(payload)
+        with self.lock:
+            row = self.db.execute("SELECT response, final FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            self.hits += 1
+        return row[0], json.loads(row[1] or "{}")
+
+    def put(self, payload, text, final):
+        key = request_key(payload)
+        final_json = json.dumps(final or {})
+        size = len(text.encode("utf-8")) + len(final_json)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, final, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, payload.get("model", ""), text, final_json, size, now, now),
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Response cache evicted {evicted} entries ({total} bytes kept)")
+
+    def stats(self):
+        with self.lock:
+            count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+
+_open_caches = {}
+_open_lock = threading.Lock()
+
+
+# One cache object per temp folder, shared by every caller in the process
+def open_cache(temp_folder, max_bytes=DEFAULT_MAX_BYTES):
+    path = os.path.abspath(os.path.join(temp_folder, CACHE_FILE))
+    with _open_lock:
+        cache = _open_caches.get(path)
+        if cache is None:
+            cache = _open_caches[path] = ResponseCache(path, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
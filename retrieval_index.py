@@ -0,0 +1,179 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import logging
+from collections import Counter
+
+# Lexical retrieval over earlier chapters and world notes. Sources are split
+# into passages of a few paragraphs and scored with BM25, so a section prompt
+# can carry the handful of passages that mention its task and characters
+# instead of every previous chapter. Sources are keyed by name with a
+# signature (file mtime and size, or a text hash); re-syncing only re-reads
+# and re-indexes the ones that changed.
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_WORDS = 150  # Paragraphs are merged until a passage reaches this size
+K1 = 1.2
+B = 0.75
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+our ours ourselves out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yourself yourselves s t said says one two also like back still
+""".split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+# Blank-line paragraphs merged into passages of about PASSAGE_WORDS words
+def split_passages(text, passage_words=PASSAGE_WORDS):
+    passages, current, words = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        current.append(paragraph)
+        words += len(paragraph.split())
+        if words >= passage_words:
+            passages.append("\n\n".join(current))
+            current, words = [], 0
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+def text_signature(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RetrievalIndex:
+    def __init__(self, passage_words=PASSAGE_WORDS):
+        self.passage_words = passage_words
+        self.lock = threading.Lock()
+        self.sources = {}  # name -> (signature, [passage ids])
+        self.passages = {}  # id -> (source name, text, token count)
+        self.postings = {}  # term -> {passage id: term frequency}
+        self.total_tokens = 0
+        self.next_id = 0
+        self.build_seconds = 0.0  # Time spent (re)indexing since creation
+
+    def __len__(self):
+        return len(self.passages)
+
+    # (Re)index a source unless its signature is unchanged; returns True when
+    # the index changed
+    def update_source(self, name, text, signature=None):
+        signature = signature or text_signature(text)
+        with self.lock:
+            if name in self.sources and self.sources[name][0] == signature:
+                return False
+            started = time.perf_counter()
+            self._remove(name)
+            ids = []
+            for passage in split_passages(text, self.passage_words):
+                counts = Counter(tokenize(passage))
+                passage_id = self.next_id
+                self.next_id += 1
+                self.passages[passage_id] = (name, passage, sum(counts.values()))
+                self.total_tokens += sum(counts.values())
+                for term, count in counts.items():
+                    self.postings.setdefault(term, {})[passage_id] = count
+                ids.append(passage_id)
+            self.sources[name] = (signature, ids)
+            self.build_seconds += time.perf_counter() - started
+            return True
+
+    def remove_source(self, name):
+        with self.lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        _, ids = self.sources.pop(name, (None, []))
+        for passage_id in ids:
+            _, passage, length = self.passages.pop(passage_id)
+            self.total_tokens -= length
+            for term in set(tokenize(passage)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(passage_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    # Index the given files, re-reading only those whose mtime or size changed,
+    # and drop file sources that are no longer listed. Returns the number of
+    # files (re)indexed.
+    def sync_files(self, paths):
+        paths = [os.path.abspath(path) for path in paths]
+        changed = 0
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                with open(path, "r", encoding="utf-8") as f:
+                    if self.update_source(path, f.read(), (stat.st_mtime_ns, stat.st_size)):
+                        changed += 1
+            except OSError as e:
+                logger.warning(f"Could not index {path}: {e}")
+        listed = set(paths)
+        for name in [name for name, (signature, _) in self.sources.items() if isinstance(signature, tuple) and name not in listed]:
+            self.remove_source(name)
+        return changed
+
+    # Top k passages for the query as (score, source, text), best first.
+    # weights (term -> weight) lets callers boost terms such as character names.
+    def query(self, text, k=5, weights=None, exclude=()):
+        terms = Counter(tokenize(text))
+        for term, weight in (weights or {}).items():
+            for token in tokenize(term):
+                terms[token] += weight
+        with self.lock:
+            count = len(self.passages)
+            if not count or not terms:
+                return []
+            average = self.total_tokens / count or 1.0
+            scores = {}
+            for term, weight in terms.items():
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, frequency in postings.items():
+                    length = self.passages[passage_id][2]
+                    score = idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average))
+                    scores[passage_id] = scores.get(passage_id, 0.0) + weight * score
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for passage_id, score in ranked:
+                name, passage, _ = self.passages[passage_id]
+                if name in exclude:
+                    continue
+                results.append((score, name, passage))
+                if len(results) == k:
+                    break
+            return results
+
+    def describe(self):
+        return (f"{len(self.sources)} sources, {len(self.passages)} passages, {len(self.postings)} terms, "
+                f"indexed in {self.build_seconds:.2f}s")
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+
+# One index per temp folder, shared by every chapter of a run
+def open_index(temp_folder):
+    path = os.path.abspath(temp_folder)
+    with _open_lock:
+        index = _open_indexes.get(path)
+        if index is None:
+            index = _open_indexes[path] = RetrievalIndex()
+        return index
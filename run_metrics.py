@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+import threading
+import time
+import logging
+
+# Per-request server timings. The closing NDJSON line of every /api/generate
+# stream carries Ollama's counters (durations in nanoseconds); they are
+# appended to run_metrics.jsonl in the temp folder together with the model and
+# tags such as chapter, section and attempt, and summarised to show whether
+# time goes to prompt evaluation, generation or model loading.
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = "run_metrics.jsonl"
+FIELDS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration")
+TAGS = ("kind", "chapter", "section", "attempt")
+RELOAD_SECONDS = 0.5  # A load_duration above this means the model was (re)loaded
+
+
+class MetricsStore:
+    def __init__(self, temp_folder):
+        self.path = os.path.join(temp_folder, METRICS_FILE)
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, model, final, tags=None):
+        row = {"time": round(time.time(), 3), "model": model}
+        row.update({tag: (tags or {}).get(tag) for tag in TAGS})
+        row.update({field: (final or {}).get(field) for field in FIELDS})
+        row["done_reason"] = (final or {}).get("done_reason")
+        row["host"] = (final or {}).get("host")  # Pool member that served the request
+        row["cached"] = bool((final or {}).get("cached"))
+        row["estimated"] = bool((final or {}).get("estimated"))  # Client-side timings of a stream cut short
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+        return row
+
+    def rows(self, since=None):
+        if not os.path.exists(self.path):
+            return []
+        rows = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or row.get("time", 0) >= since:
+                    rows.append(row)
+        return rows
+
+    def export_csv(self, csv_path, since=None):
+        rows = self.rows(since)
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=("time", "model") + TAGS + FIELDS + ("done_reason", "host", "cached", "estimated"))
+            writer.writeheader()
+            writer.writerows(rows)
+        return csv_path
+
+    # Rows since the given time, or since the store was opened
+    def summary(self, since=None):
+        return summarize(self.rows(self.started if since is None else since))
+
+    def describe(self, since=None):
+        return describe(self.summary(since))
+
+
+def summarize(rows):
+    timed = [row for row in rows if not row.get("cached") and row.get("total_duration")]
+    seconds = lambda field: sum(row.get(field) or 0 for row in timed) / 1e9
+    total, load, prompt, generation = seconds("total_duration"), seconds("load_duration"), seconds("prompt_eval_duration"), seconds("eval_duration")
+    prompt_tokens = sum(row.get("prompt_eval_count") or 0 for row in timed)
+    generated = sum(row.get("eval_count") or 0 for row in timed)
+    reloads = sum(1 for row in timed if (row.get("load_duration") or 0) / 1e9 > RELOAD_SECONDS)
+    switches, previous_model = 0, None
+    for row in timed:
+        if previous_model and row["model"] != previous_model:
+            switches += 1
+        previous_model = row["model"]
+    return {
+        "requests": len(rows),
+        "cached": sum(1 for row in rows if row.get("cached")),
+        "stopped_early": sum(1 for row in rows if row.get("done_reason") == "stop_controller"),
+        "server_seconds": round(total, 2),
+        "load_seconds": round(load, 2),
+        "prompt_eval_seconds": round(prompt, 2),
+        "eval_seconds": round(generation, 2),
+        "prompt_eval_share": round(prompt / total, 3) if total else 0.0,
+        "load_share": round(load / total, 3) if total else 0.0,
+        "prompt_tokens_per_s": round(prompt_tokens / prompt, 1) if prompt and prompt_tokens else None,
+        "tokens_per_s": round(generated / generation, 1) if generation else None,
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": generated,
+        "model_reloads": reloads,
+        "model_switches": switches,
+    }
+
+
+def describe(summary):
+    if not summary["requests"]:
+        return "No requests recorded."
+    return (f"{summary['requests']} requests ({summary['cached']} cached, {summary['stopped_early']} stopped early): "
+            f"{summary['server_seconds']}s on the server, {summary['prompt_eval_share']:.0%} prompt eval, "
+            f"{summary['load_share']:.0%} model loading; {summary['tokens_per_s']} tokens/s generated, "
+            f"{summary['prompt_tokens_per_s']} prompt tokens/s; {summary['model_reloads']} model reloads")
+
+
+_open_stores = {}
+_open_lock = threading.Lock()
+
+
+def open_metrics(temp_folder):
+    path = os.path.abspath(os.path.join(temp_folder, METRICS_FILE))
+    with _open_lock:
+        store = _open_stores.get(path)
+        if store is None:
+            store = _open_stores[path] = MetricsStore(temp_folder)
+        return store
@@ -0,0 +1,868 @@
+import asyncio
+import json
+import os
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import ollama_client
+import story_memory
+import story_review
+import generation_journal
+import lore_store
+import manuscript_index
+import manuscript_store
+import project_loader
+import retrieval_index
+from task_scheduler import TaskGraph
+from prompt_builder import PromptAssembler, PromptEvalTracker, estimate_tokens, get_budget, indented_tokens, stable_json
+
+# Headless generation engine shared by the Tk GUI and the batch CLI.
+# Nothing in here touches tkinter: inputs come in as plain data/paths and
+# chapter text goes out as return values and files in the temp folder.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemma3:27b"
+DEFAULT_STYLE = "30-40% witty dialogue, 60-70% dark atmosphere"
+FIRST_CHAPTER = 2  # Chapter 1 is the seed story file
+MEMORY_MODES = ("full", "summary", "retrieval")
+ENHANCE_SCOPES = ("chapter", "book")
+DEFAULT_MEMORY_BUDGET = 6000  # Tokens of previous-chapter context in "summary" mode
+SECTION_TASK_TOKENS = 400  # Allowance for the per-section task appended to the chapter prefix
+DEFAULT_WORD_CEILING = 1.2
+NEIGHBOUR_WORDS = 600  # Words of the previous enhanced chapter shown in chapter-scoped enhancement
+RETRIEVAL_PASSAGES = 5  # Passages retrieved per section in "retrieval" mode
+RETRIEVAL_WORDS = 900  # Cap on the retrieved passages' total length
+RECENT_WORDS = 800  # End of the previous chapter kept verbatim in "retrieval" mode
+WORLD_FILE = "temp_world.txt"  # World Building output, indexed for retrieval
+MODEL_LIST_FILE = os.path.join(os.path.expanduser("~"), ".ollama_book_writer_models.json")
+DISCOVERY_TIMEOUT = (2.0, 3.0)  # Connect/read seconds for the GUI's background model lookup
+
+
+class GenerationError(Exception):
+    pass
+
+
+class BookProject:
+    def __init__(self, storyboard_data=None, characters_data=None, instruction_text="", other_info_text="", book_text="", temp_folder=None):
+        self.storyboard_data = storyboard_data or {}
+        self.characters_data = characters_data or {}
+        self.instruction_text = instruction_text
+        self.other_info_text = other_info_text
+        self.book_text = book_text  # The seed story; enhancement reads the whole book from the store when it is empty
+        self.temp_folder = temp_folder or os.getcwd()
+        # "full" pastes every previous chapter; "summary" keeps the latest in
+        # full plus cached summaries of earlier ones within memory_budget tokens
+        # "retrieval" keeps the end of the previous chapter and gives each
+        # section the earlier passages (chapters, world notes) most relevant
+        # to its task and characters
+        self.memory_mode = "full"
+        self.memory_budget = DEFAULT_MEMORY_BUDGET
+        self.world_files = []  # Extra world notes indexed in "retrieval" mode
+        # Optional manuscript_store.ManuscriptStore that saved chapters are
+        # added to; the final story is assembled from it
+        self.manuscript = None
+        # Section checkpoint journal (generation_journal.GenerationJournal) and
+        # whether finished/partial sections in it should be reused
+        self.journal = None
+        self.resume = False
+        # Optional ollama_client.CancelToken and on_token(section_index, chunk)
+        # live-stream callback, used by the GUI worker thread
+        self.cancel = None
+        self.on_token = None
+        # Streams are cut at the first sentence end past word_ceiling times a
+        # section's word count (0 lets the server finish on its own)
+        self.word_ceiling = DEFAULT_WORD_CEILING
+
+    @property
+    def chapters(self):
+        return self.storyboard_data.get("chapters", [])
+
+
+# Build a project from file paths; any path may be None. Inputs come from
+# project_loader's cache and are validated there (ProjectError).
+def load_project(storyboard_path=None, characters_path=None, instructions_path=None, other_info_path=None, story_path=None, temp_folder=None):
+    project = BookProject(temp_folder=temp_folder)
+    if characters_path:
+        project.characters_data = project_loader.load_characters(characters_path)
+        logger.info(f"Characters loaded: {len(project.characters_data)} entries")
+    if storyboard_path:
+        project.storyboard_data = project_loader.load_storyboard(storyboard_path)
+    if instructions_path:
+        project.instruction_text = project_loader.load_text(instructions_path)
+        logger.info(f"Instructions loaded: {len(project.instruction_text)} chars")
+    if other_info_path:
+        project.other_info_text = project_loader.load_text(other_info_path)
+        logger.info(f"Other Info loaded: {len(project.other_info_text)} chars")
+    if story_path:
+        project.book_text = project_loader.load_text(story_path)
+    if project.characters_data:
+        unknown = project_loader.unknown_characters(project.storyboard_data, project.characters_data)
+        if unknown:
+            logger.warning(f"characters_present names not in the characters file: {', '.join(unknown)}")
+    logger.info(f"Temp folder set to: {project.temp_folder}")
+    return project
+
+
+# Point the engine logger at a per-run log file in the temp folder
+def setup_run_log(temp_folder, file_name):
+    log_file = os.path.join(temp_folder, file_name)
+    file_handler = logging.FileHandler(log_file, mode='a')
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    logger.handlers = [file_handler]
+    logger.info(f"Logging initialized to: {log_file}")
+    return log_file
+
+
+def _status(status, message):
+    if status:
+        status(message)
+    else:
+        logger.info(message)
+
+
+# Stream a /api/generate call through the shared pooled client and return
+# (text, final); the prompt's prompt_eval_count is recorded on tracker when given.
+def _stream_request(request_json, tracker=None, on_token=None, cancel=None, stop=None, tags=None):
+    text, final = ollama_client.get_client().generate(request_json, on_token, cancel, stop, tags)
+    get_budget().observe(text, final)
+    if tracker and "context" not in request_json:  # Context continuations have no comparable prompt text
+        tracker.record(request_json["prompt"], final)
+    return text, final
+
+
+def _stream_generate(request_json, tracker=None, on_token=None, cancel=None, stop=None, tags=None):
+    return _stream_request(request_json, tracker, on_token, cancel, stop, tags)[0]
+
+
+def _log_metrics(label, since):
+    metrics = ollama_client.get_client().metrics
+    if metrics is not None:
+        logger.info(f"{label} server metrics: {metrics.describe(since)}")
+
+
+# Ask the server for its models and remember them; None when it does not answer
+def refresh_model_list(timeout=None):
+    client = ollama_client.get_client()
+    try:
+        models = client.list_models(timeout=timeout)
+    except Exception as e:
+        print(f"Error fetching Ollama models: {e}")
+        return None
+    if models:
+        _save_model_list(client.base_url, models)
+    return models
+
+
+# Last model list seen from the configured server, for display before it answers
+def cached_models():
+    try:
+        with open(MODEL_LIST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get(ollama_client.get_client().base_url, [])
+    except (OSError, ValueError, AttributeError):
+        return []
+
+
+def _save_model_list(base_url, models):
+    try:
+        with open(MODEL_LIST_FILE, "r", encoding="utf-8") as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+    if not isinstance(known, dict) or known.get(base_url) == models:
+        return
+    known[base_url] = models
+    try:
+        with open(MODEL_LIST_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(known, f, indent=2)
+        os.replace(MODEL_LIST_FILE + ".tmp", MODEL_LIST_FILE)
+    except OSError as e:
+        logger.warning(f"Could not cache the model list: {e}")
+
+
+# Previous chapters as (label, text) pairs in story order
+def _previous_chapters(project, chapter_pos):
+    if chapter_pos == FIRST_CHAPTER:
+        seed = seed_text(project)
+        return [("Chapter 1", seed)] if seed else []
+    previous = []
+    for i in range(1, chapter_pos):
+        prev_file = os.path.join(project.temp_folder, f"temp_chapter_{i}.txt")
+        logger.info(f"Checking previous chapter file: {prev_file}")
+        if os.path.exists(prev_file):
+            try:
+                with open(prev_file, "r", encoding="utf-8") as f:
+                    previous.append((f"Chapter {i}", f.read().strip()))
+                logger.info(f"Loaded previous chapter: {prev_file}")
+            except Exception as e:
+                logger.error(f"Failed to load {prev_file}: {e}")
+        else:
+            logger.warning(f"Previous chapter file not found: {prev_file}")
+    return previous
+
+
+def _add_previous_chapters(prompt, project, chapter_pos, model):
+    previous = _previous_chapters(project, chapter_pos)
+    if project.memory_mode == "summary":
+        summaries, latest = story_memory.build_memory(previous, project.temp_folder, model, project.memory_budget)
+        prompt.add("Story so far (summaries of earlier chapters)", summaries, trim=1)
+        prompt.add("Previous Chapter (full text)", latest, trim=2)
+    elif project.memory_mode == "retrieval":
+        latest = previous[-1][1] if previous else ""
+        prompt.add("Previous Chapter (ending)", " ".join(latest.split()[-RECENT_WORDS:]), trim=2)
+    else:
+        prompt.add("Previous Chapters (full context)", "\n\n".join(text for _, text in previous), trim=1)
+
+
+# Index the seed story, chapter files before this one and world notes;
+# unchanged files are not re-read. With a manuscript store, book_text is the
+# whole book (seed plus every generated chapter), so only the store's seed
+# file is indexed; without one, book_text is the seed.
+def _retrieval_index(project, chapter_num):
+    index = retrieval_index.open_index(project.temp_folder)
+    paths = [os.path.join(project.temp_folder, WORLD_FILE)] if os.path.exists(os.path.join(project.temp_folder, WORLD_FILE)) else []
+    seed_path = project.manuscript.seed_path() if project.manuscript is not None else None
+    if seed_path:
+        index.remove_source("Chapter 1")
+        paths.append(seed_path)
+    elif project.manuscript is None and project.book_text:
+        index.update_source("Chapter 1", project.book_text)
+    else:
+        index.remove_source("Chapter 1")
+    paths += project.world_files
+    for name in os.listdir(project.temp_folder):
+        match = re.fullmatch(r"temp_chapter_(\d+)\.txt", name)
+        if match and int(match.group(1)) < chapter_num:
+            paths.append(os.path.join(project.temp_folder, name))
+    started = time.perf_counter()
+    changed = index.sync_files(paths)
+    logger.info(f"Retrieval index: {changed} files re-indexed in {time.perf_counter() - started:.2f}s; {index.describe()}")
+    return index
+
+
+def _source_label(name):
+    if os.path.basename(name) == manuscript_store.SEED_FILE:
+        return "Chapter 1"
+    match = re.fullmatch(r"temp_chapter_(\d+)\.txt", os.path.basename(name))
+    return f"Chapter {match.group(1)}" if match else os.path.basename(name)
+
+
+# Earlier passages most relevant to a section, within RETRIEVAL_WORDS
+def _retrieved_passages(index, query, characters):
+    started = time.perf_counter()
+    hits = index.query(query, RETRIEVAL_PASSAGES, weights={name: 2 for name in characters})
+    passages, words = [], 0
+    for _, name, passage in hits:
+        passage_words = passage.split()
+        if words + len(passage_words) > RETRIEVAL_WORDS:
+            passage_words = passage_words[:RETRIEVAL_WORDS - words]
+            if len(passage_words) < 40:
+                break
+            passage = " ".join(passage_words) + " ..."
+        passages.append(f"[{_source_label(name)}]\n{passage}")
+        words += len(passage_words)
+    logger.info(f"Retrieved {len(passages)} passages ({words} words) in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return "\n\n".join(passages)
+
+
+STORY_SYSTEM_MESSAGE = """
+You are a precise storytelling engine with a 128k token context window. Your task is to write a single chapter based on a JSON storyboard.
+The storyboard specifies the chapter’s setting, characters, and exact section tasks with minimum word counts.
+Use ONLY the specified setting, characters, and tasks. Do not deviate, repeat prior content, or introduce unlisted elements unless instructed.
+Generate the full section without stopping, meeting or exceeding the minimum word count. Output ONLY the narrative text—no titles, no commentary.
+Aim for at least 2000 words for the chapter, using the full context provided without truncation. More words are acceptable.
+"""
+
+
+CONTINUATION_TAIL_CHARS = 1500  # Output tail resent when no context is available
+OVERLAP_CHARS = 300  # Longest repeated lead-in trimmed from a continuation
+
+
+# Build a retry request that only asks for the missing words. With the
+# previous response's context tokens the server resumes from its own KV state
+# and evaluates just the short instruction; otherwise the (prefix-cached)
+# section prompt is resent with a bounded tail of the output, never all of it.
+def _continuation_request(request_json, section_prompt, temp_text, section_word_count, context=None):
+    remaining = max(section_word_count - len(temp_text.split()), 50)
+    if temp_text.strip().endswith((".", "!", "?")):
+        instruction = f"Continue the narrative seamlessly for about {remaining} more words."
+    else:
+        instruction = f"Complete the last sentence naturally, then continue the narrative for about {remaining} more words."
+    instruction += " Output ONLY the new text; do not repeat anything already written."
+    continuation = dict(request_json)
+    continuation.pop("context", None)
+    # Same num_ctx as the first attempt so the loaded runner and its KV state are reused
+    continuation["options"] = dict(request_json["options"], num_predict=get_budget().predict_tokens(remaining))
+    if context:
+        continuation["prompt"] = instruction
+        continuation["context"] = context
+    else:
+        tail = temp_text[-CONTINUATION_TAIL_CHARS:]
+        continuation["prompt"] = section_prompt + f"\n\nThe section so far ends with:\n...{tail}\n\n{instruction}"
+    return continuation
+
+
+# Drop a lead-in that repeats the end of what was already written
+def _strip_overlap(existing, new_text):
+    stripped = new_text.lstrip()
+    for size in range(min(OVERLAP_CHARS, len(existing), len(stripped)), 20, -1):
+        if existing.endswith(stripped[:size]):
+            return stripped[size:]
+    return new_text
+
+
+# Generate one section with retries. When the plan carries a journal, every
+# chunk and the finished section are checkpointed; on resume a finished
+# section is returned from the journal and a partial one is continued.
+def _generate_section(section, model, plan):
+    section_prompt = section["prompt"]
+    section_task = section["task"]
+    section_word_count = section["word_count"]
+    tracker = plan["tracker"]
+    journal = plan.get("journal")
+    key = section.get("key")
+    project_on_token = plan.get("on_token")
+    on_token = (lambda chunk: project_on_token(section["index"], chunk)) if project_on_token else None
+
+    temp_text = ""
+    request_json = get_budget().request(model, section_prompt, words=section_word_count, temperature=0.5, num_ctx=plan.get("num_ctx"))
+    if journal:
+        if plan.get("resume"):
+            done_text = journal.completed_text(key)
+            if done_text is not None:
+                logger.info(f"Section '{section_task}' restored from journal ({len(done_text.split())} words)")
+                return done_text
+            temp_text = journal.partial_text(key)
+            if temp_text:
+                logger.info(f"Section '{section_task}' resuming after {len(temp_text.split())} journaled words")
+                request_json = _continuation_request(request_json, section_prompt, temp_text, section_word_count)
+        if not temp_text:
+            journal.start_section(key)
+        live_token = on_token
+
+        def on_token(chunk):
+            journal.record_chunk(key, chunk)
+            if live_token:
+                live_token(chunk)
+
+    base_request = dict(request_json, prompt=section_prompt)
+    failed = False
+    retries = 0
+    max_retries = 5
+    while retries < max_retries:
+        try:
+            ceiling = plan.get("word_ceiling")
+            stop = ollama_client.WordCeiling(int(section_word_count * ceiling), len(temp_text.split())) if ceiling else None
+            tags = {"kind": "section", "chapter": plan["number"], "section": section["index"] + 1, "attempt": retries + 1}
+            new_text, final = _stream_request(request_json, tracker, on_token, plan.get("cancel"), stop, tags)
+            if stop and stop.stopped:
+                logger.info(f"Section '{section_task}' stream stopped at the word ceiling ({stop.words} words)")
+            temp_text += _strip_overlap(temp_text, new_text) if temp_text else new_text
+            failed = False
+            section_words = len(temp_text.split())
+            is_complete = temp_text.strip().endswith((".", "!", "?"))
+            logger.info(f"Section '{section_task}' attempt {retries + 1}: {section_words} words, Raw response length: {len(temp_text)} chars")
+
+            # Only retry if below minimum or incomplete
+            if section_words >= section_word_count and is_complete:
+                break  # Meets minimum and complete
+            elif retries < max_retries - 1:
+                retries += 1
+                request_json = _continuation_request(base_request, section_prompt, temp_text, section_word_count, final.get("context"))
+                logger.info(f"Retry {retries}: continuation prompt {len(request_json['prompt'])} chars ({'context tokens' if 'context' in request_json else 'output tail'})")
+                if not is_complete:
+                    logger.info(f"Retry {retries}: Forcing sentence completion")
+                else:
+                    logger.warning(f"Retry {retries}: Output too short ({section_words} vs {section_word_count} minimum)")
+            else:
+                break  # Max retries reached
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"API error on section '{section_task}': {e}")
+            temp_text = f"[API Error: Failed to generate section. {e}] " * (section_word_count // 10)
+            request_json = base_request
+            failed = True
+            if journal:
+                journal.start_section(key)
+            retries += 1
+            if retries == max_retries:
+                break
+
+    # Only pad if below minimum
+    section_words = len(temp_text.split())
+    if section_words < section_word_count:
+        shortfall = section_word_count - section_words
+        temp_text += f" The desert stretched on, silent but for the hum of unseen machines." * (shortfall // 20)
+        if not temp_text.strip().endswith((".", "!", "?")):
+            temp_text += " The end came swiftly."
+    # No trimming—keep all excess
+    temp_text = temp_text.strip()
+    if journal and not failed:
+        journal.record_section(key, temp_text)
+    return temp_text
+
+
+# Work out everything a chapter needs before any request is sent: chapter
+# metadata plus one (task, word_count, prompt) entry per storyboard section.
+# chapter_pos follows the GUI's numbering: position 2 is the first storyboard
+# chapter (chapter 1 being the seed text).
+def plan_chapter(project, chapter_pos, model=DEFAULT_MODEL):
+    if not project.storyboard_data or "chapters" not in project.storyboard_data:
+        raise GenerationError("No valid storyboard JSON loaded.")
+
+    chapters = project.chapters
+    if chapter_pos - FIRST_CHAPTER >= len(chapters):
+        raise GenerationError("All chapters generated! Reset or load a new storyboard.")
+
+    chapter = chapters[chapter_pos - FIRST_CHAPTER]
+    chapter_num = chapter.get("number", chapter_pos)
+    chapter_title = chapter.get("title", "")
+    chapter_setting = chapter.get("setting", "")
+    chapter_sections = chapter.get("sections", [])
+    chapter_characters = chapter.get("characters_present", [])
+    chapter_style = chapter.get("style", project.storyboard_data.get("notes", {}).get("default_style", DEFAULT_STYLE))
+
+    # Book-level blocks never change during a run, previous chapters only grow
+    # at the end, and the chapter header is shared by all of its sections.
+    prompt = _story_base_prompt(project).extend()
+    _add_previous_chapters(prompt, project, chapter_pos, model)
+    characters = project_loader.chapter_characters(project.characters_data, chapter)
+    prompt.add("Characters (JSON)", stable_json(characters))
+    saved_tokens = indented_tokens(project.characters_data) - estimate_tokens(stable_json(characters)) if characters else 0
+    prompt.add(None, f"Generate Chapter {chapter_num}: {chapter_title} with at least 2000 words, following the sections below:")
+
+    # One num_ctx for the whole chapter, sized for its longest section, so
+    # every section request runs on the same loaded context.
+    budget = get_budget()
+    max_words = max([section.get("word_count", 400) for section in chapter_sections] or [400])
+    index = _retrieval_index(project, chapter_num) if project.memory_mode == "retrieval" else None
+    reserve = SECTION_TASK_TOKENS + (int(RETRIEVAL_WORDS * 1.6) if index is not None else 0)
+    untrimmed_prefix = prompt.prefix  # Journal keys must not depend on how fit() trimmed it
+    prompt = prompt.fit(budget.prompt_budget(max_words) - reserve)
+    num_ctx = budget.context_size(estimate_tokens(prompt.prefix) + reserve, budget.predict_tokens(max_words))
+    logger.info(f"Chapter {chapter_num}: prompt prefix ~{estimate_tokens(prompt.prefix)} tokens, num_ctx {num_ctx}; "
+                f"{len(characters)} of {len(project.characters_data)} characters in compact JSON, ~{saved_tokens} tokens saved per prompt")
+
+    sections = []
+    for section_idx, section in enumerate(chapter_sections):
+        section_task = section.get("task", "")
+        section_word_count = section.get("word_count", 400)  # Minimum word count
+        section_instructions = section.get("instructions", "Describe in detail.")
+        retrieved = ""
+        if index is not None:
+            retrieved = _retrieved_passages(index, f"{section_task} {section_instructions} {chapter_setting}", chapter_characters)
+            retrieved = f"Relevant earlier passages (for continuity only; do not repeat them):\n{retrieved}\n\n" if retrieved else ""
+
+        task = (
+            retrieved +
+            f"WRITE THIS EXACT STORY SECTION AND NOTHING ELSE:\n"
+            f"Setting: {chapter_setting}\n"
+            f"Characters Present: {', '.join(chapter_characters)}\n"
+            f"Task: {section_task}\n"
+            f"Instructions: {section_instructions}\n"
+            f"Generate at least {section_word_count} words of narrative text using ONLY the above. "
+            f"Complete the full section without stopping, exceeding the minimum if desired. "
+            f"Style: {chapter_style}. "
+            f"Output ONLY the narrative text—no titles, no commentary, no deviations. "
+            f"Shift scenes explicitly when needed (e.g., 'Now shift to Vic’s POV')."
+        )
+        section_prompt = prompt.build(task)
+        logger.info(f"Full prompt length for section {section_idx + 1}: {len(section_prompt)} chars")
+        sections.append({"index": section_idx, "task": section_task, "word_count": section_word_count, "prompt": section_prompt,
+                         "key": generation_journal.section_key(chapter_num, section_idx, untrimmed_prefix, task)})
+
+    return {"pos": chapter_pos, "number": chapter_num, "title": chapter_title, "sections": sections,
+            "num_ctx": num_ctx, "saved_tokens": saved_tokens, "word_ceiling": project.word_ceiling, "tracker": PromptEvalTracker(), "journal": project.journal, "book": book_key(project), "resume": project.resume,
+            "cancel": project.cancel, "on_token": project.on_token}
+
+
+def _story_base_prompt(project):
+    prompt = PromptAssembler()
+    prompt.add(None, STORY_SYSTEM_MESSAGE)
+    prompt.add("Instructions", project.instruction_text, trim=4)
+    prompt.add("Other Info", project.other_info_text, trim=3)
+    return prompt
+
+
+# Join section texts in storyboard order, pad to the chapter minimum and save
+def finish_chapter(project, plan, section_texts, status=None):
+    chunk_text = ""
+    total_word_count = 0
+    for temp_text in section_texts:
+        chunk_text += temp_text + "\n\n"
+        total_word_count += len(temp_text.split())
+
+    # Ensure chapter minimum of 2000 words
+    if total_word_count < 2000:
+        chunk_text += " The desert stretched on, silent but for the hum of unseen machines." * ((2000 - total_word_count) // 20)
+        total_word_count = len(chunk_text.split())
+
+    chapter_num = plan["number"]
+    temp_file_path = os.path.join(project.temp_folder, f"temp_chapter_{chapter_num}.txt")
+    with open(temp_file_path, "w", encoding="utf-8") as temp_file:
+        temp_file.write(chunk_text)
+    logger.info(f"Saved temp file: {temp_file_path}, Word count: {total_word_count}")
+    if project.manuscript is not None:
+        project.manuscript.add_chapter(chapter_num, temp_file_path)
+    if project.memory_mode == "retrieval":
+        stat = os.stat(temp_file_path)
+        retrieval_index.open_index(project.temp_folder).update_source(os.path.abspath(temp_file_path), chunk_text, (stat.st_mtime_ns, stat.st_size))
+    logger.info(f"Chapter {chapter_num} {plan['tracker'].describe()}")
+    saved_tokens = plan.get("saved_tokens", 0) * len(plan["sections"])
+    logger.info(f"Chapter {chapter_num}: compact character JSON saved ~{saved_tokens} prompt tokens over {len(plan['sections'])} sections")
+    if plan.get("journal"):
+        plan["journal"].record_chapter(chapter_num, temp_file_path, plan.get("book"))
+    _status(status, f"Chapter {chapter_num} generated and saved: {temp_file_path} ({total_word_count} words, minimum 2000)")
+    return {"number": chapter_num, "title": plan["title"], "text": chunk_text, "path": temp_file_path, "word_count": total_word_count,
+            "saved_tokens": saved_tokens}
+
+
+def _announce_chapter(plan, status):
+    _status(status, f"Generating Chapter {plan['number']}: {plan['title']} (~2000+ words)...")
+    logger.info(f"Generating Chapter {plan['number']}: {plan['title']}")
+
+
+# Generate one storyboard chapter, one section request at a time.
+# With concurrency > 1 the sections are sent in parallel instead.
+def generate_chapter(project, chapter_pos, model=DEFAULT_MODEL, status=None, concurrency=1):
+    if concurrency > 1:
+        return asyncio.run(_run_chapters_async(project, [chapter_pos], model, concurrency, status))[0]
+    plan = plan_chapter(project, chapter_pos, model)
+    _announce_chapter(plan, status)
+    section_texts = [_generate_section(s, model, plan) for s in plan["sections"]]
+    return finish_chapter(project, plan, section_texts, status)
+
+
+# Checkpoint every section into the temp folder's journal; with resume=True
+# sections already in it are reused instead of regenerated.
+def enable_journal(project, resume=False):
+    project.journal = generation_journal.open_journal(project.temp_folder)
+    project.journal.compact()
+    project.resume = resume
+    return project.journal
+
+
+# The seed story: the store's seed part, or book_text when there is no store
+def seed_text(project):
+    return project.manuscript.seed_text() if project.manuscript is not None else project.book_text
+
+
+# Identifies the book a journal's saved chapters belong to
+def book_key(project):
+    return generation_journal.book_key(seed_text(project).strip(), stable_json(project.storyboard_data))
+
+
+# First chapter position whose chapter file the journal has not seen saved
+# for this seed and storyboard
+def resume_position(project):
+    journal = project.journal or generation_journal.open_journal(project.temp_folder)
+    book = book_key(project)
+    for index, chapter in enumerate(project.chapters):
+        chapter_pos = FIRST_CHAPTER + index
+        if not journal.has_chapter(chapter.get("number", chapter_pos), book):
+            return chapter_pos
+    return FIRST_CHAPTER + len(project.chapters)
+
+
+def write_final_story(temp_folder, story_text, file_name="temp_story_final.txt"):
+    final_file_path = os.path.join(temp_folder, file_name)
+    with open(final_file_path, "w", encoding="utf-8") as final_file:
+        final_file.write(story_text)
+    logger.info(f"Saved final story: {final_file_path}")
+    return final_file_path
+
+
+# Stream the project's manuscript store into the final story file
+def assemble_story(project, file_name="temp_story_final.txt"):
+    final_file_path = project.manuscript.assemble(os.path.join(project.temp_folder, file_name))
+    logger.info(f"Saved final story: {final_file_path}")
+    return final_file_path
+
+
+# Generate every remaining chapter and assemble the final story file.
+# concurrency bounds the number of /api/generate requests in flight (match it
+# to the server's OLLAMA_NUM_PARALLEL). Sections of a chapter always run side
+# by side; with independent_chapters=True whole chapters do too, each seeing
+# only the chapters that were on disk when the run started.
+def generate_book(project, model=DEFAULT_MODEL, start_pos=FIRST_CHAPTER, status=None, concurrency=1, independent_chapters=False):
+    started = time.time()
+    if project.manuscript is None:
+        project.manuscript = manuscript_store.open_store(project.temp_folder)
+        project.manuscript.reset(project.book_text)
+    positions = list(range(start_pos, FIRST_CHAPTER + len(project.chapters)))
+    if concurrency > 1:
+        results = asyncio.run(_run_chapters_async(project, positions, model, concurrency, status, independent_chapters))
+    else:
+        results = [generate_chapter(project, chapter_pos, model, status) for chapter_pos in positions]
+    assemble_story(project)
+    _log_metrics("Book", started)
+    return results
+
+
+async def _generate_chapter_async(project, plan, model, semaphore, executor, status):
+    loop = asyncio.get_running_loop()
+
+    async def run_section(section):
+        async with semaphore:
+            return await loop.run_in_executor(executor, _generate_section, section, model, plan)
+
+    _announce_chapter(plan, status)
+    section_texts = await asyncio.gather(*(run_section(s) for s in plan["sections"]))
+    return finish_chapter(project, plan, section_texts, status)
+
+
+async def _run_chapters_async(project, positions, model, concurrency, status, independent_chapters=False):
+    semaphore = asyncio.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if independent_chapters:
+            plans = [plan_chapter(project, chapter_pos, model) for chapter_pos in positions]
+            return list(await asyncio.gather(*(_generate_chapter_async(project, plan, model, semaphore, executor, status) for plan in plans)))
+        results = []
+        for chapter_pos in positions:
+            plan = plan_chapter(project, chapter_pos, model)
+            results.append(await _generate_chapter_async(project, plan, model, semaphore, executor, status))
+        return results
+
+
+ENHANCE_SYSTEM_MESSAGE = """
+You are a collaborative storyteller. Your task is to enhance an existing story based on a JSON storyboard.
+The storyboard outlines chapters with titles, settings, characters, and sections with specific tasks and word counts.
+You MUST adhere to the JSON, enriching only the specified characters, settings, and events with additional detail.
+Output only the narrative text, no commentary or questions.
+"""
+
+
+# Enhancement runs as a task graph: the sections of a chapter need only the
+# previous enhanced chapter, so they run side by side (up to concurrency
+# requests) as soon as it is assembled, and each chapter is assembled as soon
+# as its sections finish. Per-task timings and the critical path are logged.
+#
+# With scope="chapter" (the default) each chapter's prompt carries only its
+# own span of the original manuscript, its storyboard entry and the edges of
+# its neighbours, so the book is evaluated about once per run instead of once
+# per section; scope="book" sends the whole story and storyboard every time.
+# Original text of each storyboard chapter for chapter-scoped enhancement.
+# Books written by the engine are manuscript store parts without chapter
+# markers, so the store's chapter parts are used when it holds all of them;
+# other manuscripts are split on their markers (or evenly).
+def _chapter_originals(project, book_text, chapter_nums):
+    if project.manuscript is not None:
+        originals = project.manuscript.chapter_texts(chapter_nums)
+        if originals is not None:
+            return originals
+    spans = manuscript_index.spans_for_chapters(book_text, chapter_nums)
+    return {number: span.text(book_text) for number, span in spans.items()}
+
+
+def enhance_story(project, model=DEFAULT_MODEL, status=None, concurrency=1, scope="chapter"):
+    book_text = project.book_text or (project.manuscript.text() if project.manuscript is not None else "")
+    if not book_text:
+        raise GenerationError("No story loaded to enhance.")
+    temp_folder = project.temp_folder
+    storyboard_data = project.storyboard_data
+    chapters = project.chapters
+    if not chapters:
+        raise GenerationError("No valid storyboard JSON loaded.")
+
+    setup_run_log(temp_folder, "llm_enhancement.log")
+    logger.info("Starting story enhancement process.")
+    started = time.time()
+
+    original_word_count = len(book_text.split())
+    target_words = original_word_count * 2
+    min_words = int(target_words * 0.9)
+    max_words = int(target_words * 1.1)
+    words_per_chunk = target_words // len(chapters)
+    min_chunk_words = int(words_per_chunk * 0.9)
+    max_chunk_words = int(words_per_chunk * 1.1)
+    chapter_nums = [chapter.get("number", i + FIRST_CHAPTER) for i, chapter in enumerate(chapters)]
+    originals = _chapter_originals(project, book_text, chapter_nums) if scope == "chapter" else None
+
+    # Everything that is identical for every section of the run goes first, in
+    # a fixed order; chapter-specific context and the section task follow.
+    base_prompt = PromptAssembler()
+    base_prompt.add(None, ENHANCE_SYSTEM_MESSAGE)
+    if originals:  # Each chapter prompt carries the chapter's own characters
+        base_prompt.add("Storyboard chapters", "\n".join(f"Chapter {num}: {chapter.get('title', '')}" for num, chapter in zip(chapter_nums, chapters)))
+    else:
+        base_prompt.add("Main characters (JSON)", stable_json(project.characters_data))
+        base_prompt.add("Storyboard outline (JSON)", stable_json(storyboard_data))
+        saved_tokens = (indented_tokens(project.characters_data) + indented_tokens(storyboard_data)
+                        - estimate_tokens(stable_json(project.characters_data) + stable_json(storyboard_data)))
+        logger.info(f"Compact characters and storyboard JSON: ~{saved_tokens} tokens saved per prompt")
+    base_prompt.add("Instructions", project.instruction_text, trim=4)
+    base_prompt.add("Other important information", project.other_info_text, trim=3)
+    if not originals:
+        base_prompt.add(f"Existing story to enhance (currently {original_word_count} words)", book_text, trim=1)
+    base_prompt.add(None, (
+        f"Task: Enhance the existing story by doubling its size to approximately {target_words} words (between {min_words} and {max_words} words). "
+        f"Maintain the {len(chapters)}-chapter structure (Chapters {chapter_nums[0]} to {chapter_nums[-1]}), expanding each chapter to approximately {words_per_chunk} words ({min_chunk_words}–{max_chunk_words} words). "
+        f"Enrich the narrative with deeper character development, additional subplots, detailed descriptions, and new events, "
+        f"while preserving the original plot points, character arcs, and tone as outlined in the JSON Storyboard."
+    ))
+    tracker = PromptEvalTracker()
+    budget = get_budget()
+
+    _status(status, "Starting enhancement...")
+    logger.info(f"Task: Enhance story to {target_words} words (±10%).")
+    logger.info(f"Using model: {model}")
+
+    def make_prompt_task(chapter, chapter_num, prev_name, next_num):
+        def run(inputs):
+            _status(status, f"Enhancing Chapter {chapter_num}: {chapter.get('title', '')} (~{words_per_chunk} words)...")
+            prev_text = inputs[prev_name].strip() if prev_name else ""
+            chapter_prompt = base_prompt.extend()
+            if originals:
+                original = originals[chapter_num]
+                following = originals[next_num].split()[:NEIGHBOUR_WORDS // 3] if next_num is not None else []
+                chapter_prompt.add("Previous Enhanced Chapter (ending)", " ".join(prev_text.split()[-NEIGHBOUR_WORDS:]), trim=2)
+                characters = project_loader.chapter_characters(project.characters_data, chapter)
+                chapter_prompt.add("Main characters (JSON)", stable_json(characters))
+                chapter_prompt.add("Storyboard chapter (JSON)", stable_json(chapter))
+                saved_tokens = (indented_tokens(project.characters_data) + indented_tokens(chapter)
+                                - estimate_tokens(stable_json(characters) + stable_json(chapter)))
+                logger.info(f"Chapter {chapter_num}: {len(characters)} of {len(project.characters_data)} characters in compact JSON, "
+                            f"~{saved_tokens} tokens saved per prompt")
+                chapter_prompt.add(f"Original Chapter {chapter_num} to enhance (currently {len(original.split())} words)", original, trim=1)
+                chapter_prompt.add("Next chapter (opening, for continuity only)", " ".join(following), trim=0)
+                chapter_prompt.add(None, f"Expand Original Chapter {chapter_num} to approximately {words_per_chunk} words, one section at a time as instructed below.")
+            else:
+                chapter_prompt.add("Previous Enhanced Chapter", prev_text, trim=2)
+            max_section_words = max([section.get("word_count", 400) * 2 for section in chapter.get("sections", [])] or [800])
+            chapter_prompt = chapter_prompt.fit(budget.prompt_budget(max_section_words) - SECTION_TASK_TOKENS)
+            num_ctx = budget.context_size(estimate_tokens(chapter_prompt.prefix) + SECTION_TASK_TOKENS, budget.predict_tokens(max_section_words))
+            return chapter_prompt, num_ctx
+        return run
+
+    def make_section_task(chapter, chapter_num, section_idx, section, prompt_name):
+        def run(inputs):
+            chapter_prompt, num_ctx = inputs[prompt_name]
+            section_task = section.get("task", "")
+            section_word_count = section.get("word_count", 400) * 2  # Double original section size
+            section_instructions = section.get("instructions", "Describe in detail.") + " Enhance with deeper character moments and richer descriptions."
+
+            chunk_prompt = chapter_prompt.build(
+                f"ENHANCE THIS EXACT STORY SECTION:\n"
+                f"Setting: {chapter.get('setting', '')}\n"
+                f"Characters Present: {', '.join(chapter.get('characters_present', []))}\n"
+                f"Task: {section_task}\n"
+                f"Instructions: {section_instructions}\n"
+                f"Generate exactly {section_word_count} words of enhanced narrative text using ONLY the above. "
+                f"Style: follow the storyboard and characters. "
+                f"Output only the narrative text, no commentary."
+            )
+            logger.info(f"Section prompt: {chunk_prompt[:500]}...")
+            request_json = budget.request(model, chunk_prompt, words=section_word_count, num_ctx=num_ctx)
+
+            on_token = (lambda chunk: project.on_token(section_idx, chunk)) if project.on_token else None
+            # Stop at the first sentence end after the target instead of
+            # generating past it and truncating mid-sentence
+            stop = ollama_client.WordCeiling(section_word_count) if project.word_ceiling else None
+            tags = {"kind": "enhance", "chapter": chapter_num, "section": section_idx + 1, "attempt": 1}
+            temp_text = _stream_generate(request_json, tracker, on_token, project.cancel, stop, tags)
+            section_words = len(temp_text.split())
+            logger.info(f"Section '{section_task}' enhanced. Word count: {section_words}")
+
+            if section_words < section_word_count:
+                temp_text += " [Padding: The desert stretched endlessly, whispering secrets.]" * ((section_word_count - section_words) // 50)
+            elif section_words > section_word_count * max(1.0, project.word_ceiling):
+                temp_text = " ".join(temp_text.split()[:int(section_word_count * max(1.0, project.word_ceiling))])
+            return temp_text
+        return run
+
+    def make_chapter_task(chapter, chapter_num, section_names):
+        def run(inputs):
+            chunk_text = f"--- Chapter {chapter_num}: {chapter.get('title', '')} ---\n"
+            total_word_count = 0
+            for name in section_names:
+                chunk_text += inputs[name] + "\n\n"
+                total_word_count += len(inputs[name].split())
+
+            logger.info(f"Chapter {chapter_num} enhanced. Total word count: {total_word_count}")
+            if total_word_count < min_chunk_words:
+                chunk_text += " [Padding: The desert stretched endlessly, whispering secrets.]" * ((min_chunk_words - total_word_count) // 50)
+                total_word_count = len(chunk_text.split())
+            elif total_word_count > max_chunk_words:
+                chunk_text = " ".join(chunk_text.split()[:max_chunk_words])
+                total_word_count = max_chunk_words
+
+            temp_file_path = os.path.join(temp_folder, f"temp_enhanced_chapter_{chapter_num}.txt")
+            with open(temp_file_path, "w", encoding="utf-8") as temp_file:
+                temp_file.write(chunk_text)
+            _status(status, f"Saved temp file: {temp_file_path}")
+            logger.info(f"Saved temp file: {temp_file_path}, Word count: {total_word_count}")
+            return chunk_text
+        return run
+
+    graph = TaskGraph()
+    prev_name = None
+    chapter_names = []
+    for i, (chapter, chapter_num) in enumerate(zip(chapters, chapter_nums)):
+        next_num = chapter_nums[i + 1] if i + 1 < len(chapters) else None
+        prompt_name = graph.add(f"chapter {chapter_num} prompt", make_prompt_task(chapter, chapter_num, prev_name, next_num), [prev_name] if prev_name else [])
+        section_names = [graph.add(f"chapter {chapter_num} section {section_idx + 1}", make_section_task(chapter, chapter_num, section_idx, section, prompt_name), [prompt_name])
+                         for section_idx, section in enumerate(chapter.get("sections", []))]
+        prev_name = graph.add(f"chapter {chapter_num}", make_chapter_task(chapter, chapter_num, section_names), section_names)
+        chapter_names.append(prev_name)
+    results = graph.run(concurrency)
+    logger.info(f"Enhancement task timings:\n{graph.describe()}")
+
+    generated_text = "".join(f"\n\n{results[name]}" for name in chapter_names)
+    accumulated_text = "".join(results[name] + "\n\n" for name in chapter_names)
+    if accumulated_text:
+        final_file_path = write_final_story(temp_folder, accumulated_text, "temp_enhanced_story_final.txt")
+        _status(status, f"Saved final temp file: {final_file_path}")
+
+    total_words = len(generated_text.split())
+    _status(status, f"Enhancement complete. Story enhanced to {total_words} words (target: {target_words}, range: {min_words}–{max_words}).")
+    logger.info(f"Enhancement process completed. Total word count: {total_words}")
+    logger.info(f"Enhancement {tracker.describe()}")
+    _log_metrics("Enhancement", started)
+    return generated_text
+
+
+# Expand the world notes. The prompt carries only the entries the request
+# names plus the entries they mention (see lore_store), or for notes without
+# named entries the passages that best match the request; the answer is
+# merged back per entry and the whole updated notes are returned. With a
+# temp_folder they are also saved as WORLD_FILE, where "retrieval" memory
+# picks them up for chapter generation.
+def generate_world_text(existing_text, prompt_text, model=DEFAULT_MODEL, on_token=None, cancel=None, temp_folder=None):
+    budget = get_budget()
+    store = lore_store.load_store(existing_text, temp_folder)
+    selected = store.select(prompt_text)
+    if selected:
+        relevant = store.render(selected)
+    elif existing_text.strip():
+        index = retrieval_index.RetrievalIndex()
+        index.update_source("world", existing_text)
+        relevant = "\n\n".join(passage for _, _, passage in index.query(prompt_text, RETRIEVAL_PASSAGES))
+    else:
+        relevant = ""
+    logger.info(f"World expansion: {len(selected)} of {len(store)} entries, {len(relevant.split())} of {len(existing_text.split())} words sent")
+    prompt = PromptAssembler()
+    prompt.add("Existing content (characters, places, lore, or world details)", relevant, trim=1)
+    prompt.add("Instructions for expansion", prompt_text)
+    prompt.add("Output format", lore_store.FORMAT_INSTRUCTIONS)
+    full_prompt = prompt.fit(budget.prompt_budget()).prefix
+    if not prompt_text.strip() and not relevant:
+        full_prompt = "Generate a description of a character or place from scratch.\n\n" + lore_store.FORMAT_INSTRUCTIONS
+    generated_text = _stream_generate(budget.request(model, full_prompt), on_token=on_token, cancel=cancel, tags={"kind": "world"})
+    if not generated_text:
+        return existing_text or "No text generated"
+    touched = store.merge_answer(generated_text, prompt_text)
+    logger.info(f"World expansion merged into {len(touched)} entries: {', '.join(touched)}")
+    if temp_folder:
+        world_text = lore_store.save_store(store, temp_folder)
+        write_final_story(temp_folder, world_text, WORLD_FILE)
+        return world_text
+    return store.render()
+
+
+# Chunked map-reduce review (see story_review); partial reviews are cached in
+# temp_folder when one is given, and up to concurrency chunks run at once.
+def generate_review_text(story_text, model=DEFAULT_MODEL, on_token=None, cancel=None, temp_folder=None, concurrency=1, status=None):
+    generated_text = story_review.review_manuscript(story_text, model, temp_folder, concurrency, on_token, cancel, status)
+    return generated_text or "No review generated"
@@ -0,0 +1,288 @@
+import difflib
+import json
+import os
+import re
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Text-only Fixer operations used by the Fixer tab and the batch CLI.
+
+logger = logging.getLogger(__name__)
+
+# Common English words that are not also common in Dutch, German, French,
+# Spanish or Italian ("in", "was", "is", "had" and "her" are)
+ENGLISH_HINTS = frozenset("""
+the and of to he she it you that with his they not but at from this were been would could him said there their
+what which have be by we my your them then when into out up has are who its our because about
+""".split())
+ENGLISH_SHARE = 0.25  # Least share of hint words in an English paragraph; prose runs 30-50%
+ENGLISH_HITS = 2  # Least distinct hint words
+POOL_MIN_SEGMENTS = 500  # Each pool worker loads langdetect's profiles first (~1 s)
+BATCH_CHARS = 4000
+BATCH_ITEMS = 25
+
+_language_memo = {}  # paragraph -> detected language, shared by every call in the process
+
+
+# ASCII paragraphs made up largely of common English words skip detection;
+# anything else goes to langdetect
+def _looks_english(text):
+    if not text.isascii():
+        return False
+    words = re.findall(r"[a-z']+", text.lower())
+    if len(words) < 3:
+        return True
+    hits = [word for word in words if word in ENGLISH_HINTS]
+    return len(hits) >= len(words) * ENGLISH_SHARE and len(set(hits)) >= ENGLISH_HITS
+
+
+def _usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _detect(text):
+    import langdetect
+    langdetect.DetectorFactory.seed = 0  # Same answer for the same text on every run
+    try:
+        return langdetect.detect(text)
+    except langdetect.lang_detect_exception.LangDetectException:
+        return "en"
+
+
+def detect_languages(texts, workers=None):
+    pending = [text for text in dict.fromkeys(texts) if text not in _language_memo]
+    workers = workers or _usable_cpus()
+    if len(pending) >= POOL_MIN_SEGMENTS and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            languages = list(pool.map(_detect, pending, chunksize=max(1, len(pending) // (4 * workers))))
+    else:
+        languages = [_detect(text) for text in pending]
+    _language_memo.update(zip(pending, languages))
+    return [_language_memo[text] for text in texts]
+
+
+# Translation backends take a list of texts and return their English versions
+# in the same order; fix_language_text() batches and de-duplicates for them.
+class GoogleTranslateBackend:
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate_batch(self, texts):
+        return [result.text for result in self.translator.translate(list(texts), dest="en")]
+
+
+class OllamaTranslateBackend:
+    def __init__(self, model):
+        self.model = model
+
+    def translate_batch(self, texts):
+        import ollama_client
+        from prompt_builder import get_budget
+        numbered = "\n".join(f"[{i + 1}] {text}" for i, text in enumerate(texts))
+        prompt = (
+            "Translate each numbered passage below into natural English. Keep the numbering, output one "
+            "\"[n] translation\" block per passage and nothing else. Passages already in English are copied unchanged.\n\n"
+            + numbered
+        )
+        request_json = get_budget().request(self.model, prompt, words=int(len(numbered.split()) * 1.3) + 20, temperature=0.1)
+        output, _ = ollama_client.get_client().generate(request_json, tags={"kind": "translate"})
+        parts = re.split(r"^\s*\[(\d+)\]\s*", output, flags=re.MULTILINE)
+        translated = {int(number): body.strip() for number, body in zip(parts[1::2], parts[2::2])}
+        if len(texts) > 1 and len(translated) != len(texts):
+            logger.warning(f"Translation batch returned {len(translated)} of {len(texts)} passages; retrying one by one")
+            return [self.translate_batch([text])[0] for text in texts]
+        return [translated.get(i + 1, text) for i, text in enumerate(texts)]
+
+
+class IdentityBackend:
+    def translate_batch(self, texts):
+        return list(texts)
+
+
+TRANSLATION_BACKENDS = ("googletrans", "ollama", "identity")
+
+
+def get_translator(name="googletrans", model=None):
+    if name == "googletrans":
+        return GoogleTranslateBackend()
+    if name == "ollama":
+        return OllamaTranslateBackend(model)
+    if name == "identity":
+        return IdentityBackend()
+    raise ValueError(f"Unknown translation backend {name!r}")
+
+
+def _batches(texts):
+    batch, size = [], 0
+    for text in texts:
+        if batch and (size + len(text) > BATCH_CHARS or len(batch) >= BATCH_ITEMS):
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+# Translate non-English paragraphs to English, leaving the layout untouched.
+# Paragraphs are detected once each (ASCII English skips detection, large
+# jobs use a process pool) and only unique foreign paragraphs are sent to
+# the translator, in batches, a few batches at a time.
+def fix_language_text(output, translator=None, workers=None, translate_workers=4):
+    pieces = re.split(r"(\n[ \t]*\n)", output)
+    candidates = [i for i in range(0, len(pieces), 2) if pieces[i].strip() and not _looks_english(pieces[i])]
+    languages = detect_languages([pieces[i].strip() for i in candidates], workers)
+    foreign = [i for i, lang in zip(candidates, languages) if lang != "en"]
+    unique = list(dict.fromkeys(pieces[i].strip() for i in foreign))
+    logger.info(f"Language fix: {len(pieces) // 2 + 1} paragraphs, {len(candidates)} checked, {len(unique)} unique to translate")
+    if not unique:
+        return output
+
+    translator = translator or get_translator()
+    with ThreadPoolExecutor(max_workers=translate_workers) as executor:
+        batches = list(_batches(unique))
+        results = executor.map(translator.translate_batch, batches)
+        translations = {}
+        for batch, translated in zip(batches, results):
+            translations.update(zip(batch, translated))
+    for i in foreign:
+        pieces[i] = translations.get(pieces[i].strip(), pieces[i])
+    return "".join(pieces)
+
+
+STORYBOARD_HEADING = re.compile(r"^--- Chapter (\d+): (.+?) ---[ \t]*$", re.MULTILINE)
+NUMBER_WORDS = {word: number for number, word in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen "
+    "seventeen eighteen nineteen twenty".split())}
+ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+# A line that is only a heading: "--- Chapter 3: Title ---", "Chapter 3", "CHAPTER THREE - Title", "Ch. IV"
+ALIGN_HEADING = re.compile(
+    r"^[ \t#*]*(?:---[ \t]*)?(?:chapter|ch\.)[ \t]+(?P<number>\d+|[ivxlc]+|" + "|".join(NUMBER_WORDS) + r")\b"
+    r"[ \t:.\-\u2013\u2014]*(?P<title>[^\n]{0,80}?)[ \t]*(?:---)?[ \t*]*$", re.IGNORECASE)
+HEADING_MAX_CHARS = 120  # Longer lines that start with "Chapter" are prose
+TITLE_MATCH = 0.5  # Least score (title similarity plus number agreement) to accept a storyboard chapter
+LOOKAHEAD = 3  # Storyboard chapters a heading may skip ahead to by title alone
+SHORT_SHARE = 0.5  # Chapters under this share of their planned words are reported as short
+EXCESS_MARKER = "[EXCESS CONTENT - Review for Epilogue or Redistribution]"
+
+
+# Storyboard chapters as {"number", "title", "sections", "words"}; JSON
+# storyboards or text ones with "--- Chapter N: Title ---" headings
+def load_storyboard_chapters(storyboard_path):
+    with open(storyboard_path, "r", encoding="utf-8") as f:
+        if storyboard_path.endswith(".json"):
+            chapters = json.load(f).get("chapters", [])
+            return [{"number": chapter.get("number", i + 1), "title": chapter.get("title", ""),
+                     "sections": len(chapter.get("sections", [])),
+                     "words": sum(section.get("word_count", 0) for section in chapter.get("sections", []))}
+                    for i, chapter in enumerate(chapters)]
+        storyboard = f.read()
+    return [{"number": int(match.group(1)), "title": match.group(2), "sections": 0, "words": 0}
+            for match in STORYBOARD_HEADING.finditer(storyboard)]
+
+
+def _heading_number(token):
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    values = [ROMAN[char] for char in token]
+    return sum(-value if following > value else value for value, following in zip(values, values[1:] + [0]))
+
+
+def _normal_title(title):
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+
+# Storyboard index for a heading, or None when it matches no chapter at or
+# after position. A heading with neither a matching title nor a matching
+# number takes the next chapter in order, unless it repeats the number of a
+# chapter already placed.
+def _match_chapter(chapters, position, number, title, placed):
+    if position >= len(chapters):
+        return None
+    title = _normal_title(title)
+    candidates = set(range(position, min(position + LOOKAHEAD, len(chapters))))
+    candidates.update(i for i in range(position, len(chapters)) if chapters[i]["number"] == number)
+    best, best_score = None, 0.0
+    for i in sorted(candidates):
+        score = difflib.SequenceMatcher(None, title, chapters[i]["normal_title"]).ratio() if title else 0.0
+        score += 0.5 if chapters[i]["number"] == number else 0.0
+        score += 0.05 if i == position else 0.0  # Ties go to the next chapter in order
+        if score > best_score:
+            best, best_score = i, score
+    if best_score >= TITLE_MATCH:
+        return best
+    return None if number in placed else position
+
+
+# Single pass over lines (any iterable, e.g. an open file): chapter headings
+# are matched against the storyboard and rewritten as
+# "--- Chapter N: Title ---", chapters beyond or repeated in the storyboard
+# are tagged as excess, and every line is written to out as it is read.
+# Returns a report with the boundary index (line and character offset of each
+# heading), per-chapter word counts and the missing and excess chapters.
+def align_stream(lines, chapters, out):
+    chapters = [dict(chapter, normal_title=_normal_title(chapter["title"])) for chapter in chapters]
+    boundaries, excess, words, placed = [], [], {}, set()
+    position, current, offset = 0, None, 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\n")
+        match = ALIGN_HEADING.match(line) if len(line) <= HEADING_MAX_CHARS and line.lstrip()[:1] in "-#*Cc" else None
+        if match:
+            number = _heading_number(match.group("number"))
+            index = _match_chapter(chapters, position, number, match.group("title"), placed)
+            placed.add(number)
+            if index is None:
+                current = ("excess", len(excess))
+                excess.append({"line": line_number, "heading": line.strip(), "words": 0})
+                out.write(f"{EXCESS_MARKER}\n{line}\n")
+            else:
+                current = ("chapter", index)
+                position = index + 1
+                chapter = chapters[index]
+                boundaries.append({"line": line_number, "offset": offset, "chapter": chapter["number"], "heading": line.strip()})
+                out.write(f"--- Chapter {chapter['number']}: {chapter['title']} ---\n")
+        else:
+            out.write(line + "\n")
+            count = len(line.split())
+            if current and current[0] == "excess":
+                excess[current[1]]["words"] += count
+            elif current:
+                words[current[1]] = words.get(current[1], 0) + count
+        offset += len(line) + 1
+    matched = {boundary["chapter"] for boundary in boundaries}
+    return {
+        "boundaries": boundaries,
+        "chapters": [{"number": chapter["number"], "title": chapter["title"], "words": words.get(i, 0), "expected_words": chapter["words"],
+                      "sections": chapter["sections"], "found": chapter["number"] in matched} for i, chapter in enumerate(chapters)],
+        "missing": [chapter["number"] for chapter in chapters if chapter["number"] not in matched],
+        "excess": excess,
+    }
+
+
+# Align a manuscript file to a storyboard, streaming into output_path
+def align_file(input_path, storyboard_path, output_path):
+    chapters = load_storyboard_chapters(storyboard_path)
+    tmp_path = output_path + ".tmp"
+    with open(input_path, "r", encoding="utf-8") as source, open(tmp_path, "w", encoding="utf-8") as out:
+        report = align_stream(source, chapters, out)
+    os.replace(tmp_path, output_path)
+    return report
+
+
+def describe_alignment(report):
+    short = [chapter for chapter in report["chapters"] if chapter["found"] and chapter["words"] < chapter["expected_words"] * SHORT_SHARE]
+    lines = [f"{len(report['boundaries'])} of {len(report['chapters'])} storyboard chapters found"]
+    if report["missing"]:
+        lines.append(f"Missing chapters: {', '.join(map(str, report['missing']))}")
+    for chapter in short:
+        lines.append(f"Chapter {chapter['number']} is short: {chapter['words']} of {chapter['expected_words']} words planned")
+    for block in report["excess"]:
+        lines.append(f"Excess content at line {block['line']} ({block['heading']!r}, {block['words']} words)")
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+import ollama_client
+from prompt_builder import estimate_tokens, get_budget
+
+# Hierarchical "story so far" memory. Instead of pasting every previous
+# chapter into each prompt, the latest chapter is kept in full and earlier
+# ones are replaced by short summaries, cached on disk by content hash so
+# each chapter is summarised once, and trimmed to a token budget.
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FILE = "chapter_summaries.json"
+SUMMARY_WORDS = 200
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChapterSummaryCache:
+    def __init__(self, temp_folder):
+        self.path = os.path.join(temp_folder, SUMMARY_FILE)
+        self.lock = threading.Lock()
+        self.summaries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.summaries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable summary cache {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.summaries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def summary_for(self, text, model):
+        key = content_hash(text)
+        with self.lock:
+            if key in self.summaries:
+                return self.summaries[key]
+        prompt = (
+            f"Summarize the following chapter in at most {SUMMARY_WORDS} words. Keep every named character, "
+            f"place, object and unresolved plot thread; drop style and dialogue. Output only the summary.\n\n{text}"
+        )
+        request_json = get_budget().request(model, prompt, words=SUMMARY_WORDS, temperature=0.2)
+        summary, _ = ollama_client.get_client().generate(request_json, tags={"kind": "summary"})
+        summary = summary.strip()
+        logger.info(f"Summarised chapter {key[:12]}: {len(text.split())} -> {len(summary.split())} words")
+        with self.lock:
+            self.summaries[key] = summary
+            self._save()
+        return summary
+
+
+# Render previous chapters, given as (label, text) pairs in story order, as
+# (earlier summaries, latest chapter) within budget_tokens. The latest chapter
+# may use up to two thirds of the budget (keeping its tail if longer); the
+# rest goes to summaries, newest first, so the oldest are dropped first.
+def build_memory(chapters, temp_folder, model, budget_tokens):
+    if not chapters:
+        return "", ""
+    latest = chapters[-1][1]
+    latest_budget_chars = budget_tokens * 2 // 3 * 4
+    if len(latest) > latest_budget_chars:
+        latest = latest[-latest_budget_chars:]
+    remaining = budget_tokens - estimate_tokens(latest)
+
+    cache = ChapterSummaryCache(temp_folder)
+    summaries = []
+    for index in range(len(chapters) - 2, -1, -1):
+        label, text = chapters[index]
+        summary = cache.summary_for(text, model) if remaining > 0 else ""
+        cost = estimate_tokens(summary)
+        if not summary or cost > remaining:
+            logger.info(f"Memory budget reached; {index + 1} oldest chapter summaries omitted")
+            break
+        summaries.append(f"{label}: {summary}")
+        remaining -= cost
+    summaries.reverse()
+    return "\n\n".join(summaries), latest
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import ollama_client
+from prompt_builder import PromptAssembler, estimate_tokens, get_budget
+from manuscript_index import chapter_spans
+from story_memory import content_hash
+
+# Map-reduce review for manuscripts of any length. The text is cut into
+# chunks (chapters where they are marked, content-defined paragraph windows
+# otherwise), every chunk is summarised and critiqued on its own, in
+# parallel, and the partial reviews are merged into the final report. Partial
+# reviews are cached on disk by content hash, so after editing one chapter a
+# re-review only redoes that chunk and the merge.
+
+logger = logging.getLogger(__name__)
+
+REVIEW_FILE = "chunk_reviews.json"
+MIN_CHUNK_WORDS = 1500
+MAX_CHUNK_WORDS = 5000
+BOUNDARY_MASK = 7  # A window may close at a paragraph whose hash & mask == 0 (~1 in 8)
+PARTIAL_WORDS = 500
+REPORT_WORDS = 2500
+
+MAP_PROMPT = (
+    "You are reviewing one part of a longer story. In at most {words} words:\n"
+    "Summary: the key events, characters and themes of this part.\n"
+    "Critique: structure, pacing, character development, dialogue, and any inconsistencies or weak areas, with specific examples.\n"
+    "Output only these two headed sections."
+)
+MERGE_PROMPT = (
+    "Below are summaries and critiques of consecutive parts of a story. Merge them into one summary and critique "
+    "of the whole span in at most {words} words, keeping the most important events and issues. "
+    "Output only a 'Summary:' and a 'Critique:' section."
+)
+REVIEW_STEPS = """
+Step 1: Summarize the entire story in approximately 1000 words, covering key events, characters, and themes.
+Step 2: Analyze the story’s structure, pacing, and character development. Identify inconsistencies or weak areas and provide constructive feedback.
+Step 3: Suggest improvements for plot coherence, dialogue, and engagement."""
+REDUCE_PROMPT = "\nBelow are summaries and critiques of consecutive parts of a story, in order." + REVIEW_STEPS
+
+
+# Split on paragraph boundaries. A window closes once it has MIN_CHUNK_WORDS
+# and reaches a paragraph whose hash hits the boundary mask (or at
+# MAX_CHUNK_WORDS), so boundaries depend on local content only and an edit
+# does not shift every later window.
+def _windows(text):
+    windows, current, words = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        if not paragraph.strip():
+            continue
+        current.append(paragraph)
+        words += len(paragraph.split())
+        boundary = int(content_hash(paragraph)[:8], 16) & BOUNDARY_MASK == 0
+        if words >= MAX_CHUNK_WORDS or (words >= MIN_CHUNK_WORDS and boundary):
+            windows.append("\n\n".join(current))
+            current, words = [], 0
+    if current:
+        if windows and words < MIN_CHUNK_WORDS // 3:
+            windows[-1] += "\n\n" + "\n\n".join(current)
+        else:
+            windows.append("\n\n".join(current))
+    return windows
+
+
+def split_manuscript(text):
+    spans = chapter_spans(text)
+    if len(spans) < 2:
+        return _windows(text)
+    chunks = []
+    for span in spans:
+        part = span.text(text)
+        if part:
+            chunks.extend(_windows(part) if len(part.split()) > MAX_CHUNK_WORDS else [part])
+    return chunks
+
+
+class ReviewCache:
+    def __init__(self, temp_folder=None):
+        self.path = os.path.join(temp_folder, REVIEW_FILE) if temp_folder else None
+        self.lock = threading.Lock()
+        self.reviews = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.reviews = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable review cache {self.path}: {e}")
+
+    def get(self, key):
+        with self.lock:
+            return self.reviews.get(key)
+
+    def put(self, key, review):
+        with self.lock:
+            self.reviews[key] = review
+            if self.path:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.reviews, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+
+
+def _partial_review(instruction, text, model, cache, cancel):
+    key = content_hash(f"{model}\0{instruction}\0{text}")
+    review = cache.get(key)
+    if review is not None:
+        return review, True
+    budget = get_budget()
+    prompt = PromptAssembler().add(None, instruction).add("Text", text, trim=1)
+    request_json = budget.request(model, prompt.fit(budget.prompt_budget(PARTIAL_WORDS)).prefix, words=PARTIAL_WORDS, temperature=0.3)
+    review, _ = ollama_client.get_client().generate(request_json, cancel=cancel, tags={"kind": "review part"})
+    review = review.strip()
+    cache.put(key, review)
+    return review, False
+
+
+def _map(instruction, texts, model, cache, concurrency, cancel):
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(lambda text: _partial_review(instruction, text, model, cache, cancel), texts))
+    return [review for review, _ in results], sum(1 for _, cached in results if cached)
+
+
+def _label(reviews):
+    return "\n\n".join(f"Part {i + 1}:\n{review}" for i, review in enumerate(reviews))
+
+
+def review_manuscript(story_text, model, temp_folder=None, concurrency=1, on_token=None, cancel=None, status=None):
+    say = status or logger.info
+    budget = get_budget()
+    cache = ReviewCache(temp_folder)
+    chunks = split_manuscript(story_text)
+    if not chunks:
+        return ""
+    if len(chunks) == 1:  # Short enough for the classic single-pass review
+        prompt = PromptAssembler().add(None, REVIEW_STEPS).add("Story", chunks[0], trim=1)
+        request_json = budget.request(model, prompt.fit(budget.prompt_budget(REPORT_WORDS)).prefix, words=REPORT_WORDS)
+        return ollama_client.get_client().generate(request_json, on_token, cancel, tags={"kind": "review"})[0]
+    say(f"Reviewing {len(chunks)} parts ({len(story_text.split())} words)...")
+    reviews, cached = _map(MAP_PROMPT.format(words=PARTIAL_WORDS), chunks, model, cache, concurrency, cancel)
+    logger.info(f"Review map: {len(chunks)} parts, {cached} from cache, {len(chunks) - cached} generated")
+
+    # Merge neighbouring partial reviews until they fit one reduce prompt
+    reduce_budget = budget.prompt_budget(REPORT_WORDS) - estimate_tokens(REDUCE_PROMPT)
+    while len(reviews) > 1 and estimate_tokens(_label(reviews)) > reduce_budget:
+        groups, group, size = [], [], 0
+        for review in reviews:
+            cost = estimate_tokens(review)
+            if group and size + cost > reduce_budget // 2:
+                groups.append(group)
+                group, size = [], 0
+            group.append(review)
+            size += cost
+        groups.append(group)
+        if len(groups) == len(reviews):
+            break  # Cannot shrink further; fit() trims the rest
+        say(f"Merging {len(reviews)} partial reviews into {len(groups)}...")
+        reviews, _ = _map(MERGE_PROMPT.format(words=PARTIAL_WORDS), ["\n\n".join(g) for g in groups], model, cache, concurrency, cancel)
+
+    say("Writing the final review...")
+    prompt = PromptAssembler().add(None, REDUCE_PROMPT).add("Partial reviews", _label(reviews), trim=1)
+    request_json = budget.request(model, prompt.fit(budget.prompt_budget(REPORT_WORDS)).prefix, words=REPORT_WORDS)
+    report, _ = ollama_client.get_client().generate(request_json, on_token, cancel, tags={"kind": "review"})
+    return report
@@ -0,0 +1,72 @@
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Minimal dependency-graph runner. Each task names the tasks whose results it
+# needs; it is submitted to a bounded thread pool the moment the last of them
+# finishes, so independent work overlaps while dependent work stays ordered.
+# Start/end times are kept per task to report the critical path afterwards.
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    def __init__(self):
+        self.tasks = {}  # name -> (fn, deps); fn receives {dep name: result}
+        self.timings = {}  # name -> (start, end) seconds since run() began
+
+    def add(self, name, fn, deps=()):
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task {name!r}")
+        missing = [dep for dep in deps if dep not in self.tasks]
+        if missing:
+            raise ValueError(f"Task {name!r} depends on unknown tasks {missing}")
+        self.tasks[name] = (fn, tuple(deps))
+        return name
+
+    def run(self, workers=1):
+        results = {}
+        remaining = dict(self.tasks)
+        running = {}
+        t0 = time.perf_counter()
+
+        def timed(name, fn, inputs):
+            start = time.perf_counter() - t0
+            try:
+                return fn(inputs)
+            finally:
+                self.timings[name] = (start, time.perf_counter() - t0)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            try:
+                while remaining or running:
+                    for name, (fn, deps) in list(remaining.items()):
+                        if all(dep in results for dep in deps):
+                            del remaining[name]
+                            future = executor.submit(timed, name, fn, {dep: results[dep] for dep in deps})
+                            running[future] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+        return results
+
+    # Longest chain of dependent tasks by measured duration: (names, seconds)
+    def critical_path(self):
+        best = {}
+        for name in self.tasks:  # Insertion order is a topological order
+            _, deps = self.tasks[name]
+            start, end = self.timings.get(name, (0.0, 0.0))
+            prior = max((best[dep] for dep in deps), key=lambda item: item[1], default=((), 0.0))
+            best[name] = (prior[0] + (name,), prior[1] + end - start)
+        return max(best.values(), key=lambda item: item[1], default=((), 0.0))
+
+    def describe(self):
+        lines = [f"{name}: {end - start:.2f}s (start {start:.2f}s)" for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0])]
+        path, seconds = self.critical_path()
+        wall = max((end for _, end in self.timings.values()), default=0.0)
+        lines.append(f"Critical path {seconds:.2f}s of {wall:.2f}s wall: {' -> '.join(path)}")
+        return "\n".join(lines)
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manuscript_store
+import story_engine
+
+
+def _generated_book(folder, numbers):
+    store = manuscript_store.ManuscriptStore(str(folder))
+    store.reset(" ".join(["seed"] * 1500))
+    for number in numbers:
+        path = os.path.join(str(folder), f"temp_chapter_{number}.txt")
+        with open(path, "w", encoding="utf-8") as f:  # Written like finish_chapter: no chapter marker
+            f.write(" ".join([f"chapter{number}"] * (500 * number)) + "\n\n")
+        store.add_chapter(number, path)
+    return store
+
+
+def _project(folder, store, numbers):
+    storyboard = {"chapters": [{"number": number, "title": f"Title {number}", "sections": [{"task": "t", "word_count": 50}]}
+                               for number in numbers]}
+    project = story_engine.BookProject(storyboard, {}, "", "", store.text(), str(folder))
+    project.manuscript = store
+    return project
+
+
+def test_chapter_originals_follow_the_store_parts(tmp_path):
+    numbers = [2, 3, 4, 5]
+    store = _generated_book(tmp_path, numbers)
+    originals = story_engine._chapter_originals(_project(tmp_path, store, numbers), store.text(), numbers)
+    for number in numbers:
+        assert set(originals[number].split()) == {f"chapter{number}"}
+        assert len(originals[number].split()) == 500 * number
+
+
+def test_enhance_prompts_hold_their_own_chapter(tmp_path, monkeypatch):
+    numbers = [2, 3, 4]
+    store = _generated_book(tmp_path, numbers)
+    prompts = []
+
+    def fake_generate(request_json, *args, **kwargs):
+        prompts.append(request_json["prompt"])
+        return "word " * 50
+
+    monkeypatch.setattr(story_engine, "_stream_generate", fake_generate)
+    story_engine.enhance_story(_project(tmp_path, store, numbers), "mock", scope="chapter")
+    assert len(prompts) == len(numbers)
+    for number, prompt in zip(numbers, prompts):
+        original = prompt.split(f"Original Chapter {number} to enhance", 1)[1].split("\n\n", 1)[0]
+        assert "seed" not in original
+        assert set(original.split(":", 1)[1].split()) == {f"chapter{number}"}